@@ -0,0 +1,156 @@
+"""
+静态资源与模板服务
+启动时扫描 static/ 和 templates/：按内容哈希生成带指纹的文件名，预先压缩出
+gzip（以及安装了 brotli 时的 br）版本。带指纹的静态资源使用长期缓存
+（immutable），模板和不带指纹的路径每次向服务器验证（ETag + 304），
+浏览器只在内容真正变化时才重新下载。
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli  # 可选依赖：pip install brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的文件压缩收益很小，不生成压缩版本
+MIN_COMPRESS_SIZE = 512
+# 适合压缩的文本类型
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+@dataclass
+class Asset:
+    """一个资源文件及其预压缩版本"""
+    content: bytes
+    media_type: str
+    digest: str
+    # 编码 -> 压缩后的内容，例如 {"br": ..., "gzip": ...}
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+
+def _build_asset(content: bytes, filename: str) -> Asset:
+    """计算摘要并生成预压缩版本"""
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+    asset = Asset(content=content, media_type=media_type,
+                  digest=hashlib.sha256(content).hexdigest()[:12])
+    if len(content) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+        if brotli is not None:
+            asset.variants["br"] = brotli.compress(content, quality=11)
+        asset.variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+    return asset
+
+
+class AssetManifest:
+    """静态资源清单：逻辑路径 <-> 带指纹路径"""
+
+    def __init__(self, static_dir: str, url_prefix: str = "/static"):
+        """
+        初始化并扫描静态资源目录
+        Args:
+            static_dir: 静态资源目录
+            url_prefix: 静态资源的URL前缀
+        """
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.assets: Dict[str, Asset] = {}          # 逻辑路径 -> 资源
+        self.fingerprinted: Dict[str, str] = {}     # 带指纹路径 -> 逻辑路径
+        self.build()
+
+    def build(self):
+        """扫描目录，计算指纹并预压缩"""
+        self.assets.clear()
+        self.fingerprinted.clear()
+        for root, _, files in os.walk(self.static_dir):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                logical = os.path.relpath(full_path, self.static_dir).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    asset = _build_asset(f.read(), filename)
+                self.assets[logical] = asset
+                stem, ext = os.path.splitext(logical)
+                self.fingerprinted[f"{stem}.{asset.digest}{ext}"] = logical
+
+    def url_for(self, logical: str) -> str:
+        """返回资源带指纹的URL，未知资源原样返回"""
+        asset = self.assets.get(logical)
+        if asset is None:
+            return f"{self.url_prefix}/{logical}"
+        stem, ext = os.path.splitext(logical)
+        return f"{self.url_prefix}/{stem}.{asset.digest}{ext}"
+
+    def rewrite_html(self, html: str) -> str:
+        """把HTML中引用的静态资源路径（/static/... 或 ../static/...）替换为带指纹的URL"""
+        pattern = re.compile(r'(?:\.\./|/)static/([\w./-]+)')
+        return pattern.sub(lambda m: self.url_for(m.group(1)), html)
+
+    def serve(self, request: Request, path: str) -> Response:
+        """
+        返回静态资源
+        带指纹的路径长期缓存；逻辑路径（旧链接）每次验证
+        """
+        logical = self.fingerprinted.get(path)
+        cache_control = IMMUTABLE_CACHE
+        if logical is None:
+            logical, cache_control = path, REVALIDATE_CACHE
+        asset = self.assets.get(logical)
+        if asset is None:
+            return Response(status_code=404)
+        return asset_response(request, asset, cache_control)
+
+
+class TemplateSet:
+    """页面模板：启动时读取、改写静态资源引用并预压缩，始终要求浏览器验证"""
+
+    def __init__(self, template_dir: str, manifest: Optional[AssetManifest] = None):
+        self.templates: Dict[str, Asset] = {}
+        for filename in os.listdir(template_dir):
+            full_path = os.path.join(template_dir, filename)
+            if not os.path.isfile(full_path):
+                continue
+            with open(full_path, encoding="utf-8") as f:
+                html = f.read()
+            if manifest is not None:
+                html = manifest.rewrite_html(html)
+            self.templates[filename] = _build_asset(html.encode("utf-8"), filename)
+
+    def serve(self, request: Request, name: str) -> Response:
+        """返回页面模板，未知模板返回404"""
+        asset = self.templates.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        return asset_response(request, asset, REVALIDATE_CACHE)
+
+
+def asset_response(request: Request, asset: Asset, cache_control: str) -> Response:
+    """
+    按 Accept-Encoding 选择预压缩版本，处理 If-None-Match 条件请求
+    """
+    accept = request.headers.get("accept-encoding", "")
+    encoding = next((enc for enc in ("br", "gzip") if enc in asset.variants and enc in accept), None)
+    etag = f'"{asset.digest}-{encoding}"' if encoding else f'"{asset.digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding"
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=asset.variants[encoding], media_type=asset.media_type, headers=headers)
+    return Response(content=asset.content, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,69 @@
+"""
+多轮对话记忆模式对比
+模拟一段100轮的对话，统计每轮发送给模型的提示词token数（估算值）：
+buffer 模式随轮数线性增长，window 模式在窗口填满后基本保持不变。
+window 模式在对话滑出窗口时会额外发起一次摘要调用，其提示词token数单独列出。
+使用本地的假模型（FakeListLLM），不会请求任何真实模型服务。
+使用方法：
+    python bench_memory.py --turns 100
+"""
+
+import argparse
+
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import get_buffer_string
+
+from chatwith_API import ChatSystem
+from window_memory import SUMMARY_PROMPT, SummaryWindowMemory, estimate_tokens
+
+# 假模型的回复，长度与真实问答相近
+FAKE_RESPONSES = [
+    "好的，这是一个常见的问题。简单来说，需要先明确目标，再根据实际情况逐步调整方案，"
+    "过程中注意记录每一步的结果，方便之后回顾和改进。",
+    "可以的。建议先从最小可行的版本做起，确认效果后再扩展功能，这样风险更小，也更容易定位问题。",
+]
+
+
+def run(memory_mode: str, turns: int):
+    """运行一段多轮对话，返回每轮的 (对话提示词token数, 摘要提示词token数)"""
+    chat_system = ChatSystem("bench-api-key", llm=FakeListLLM(responses=FAKE_RESPONSES),
+                             memory_mode=memory_mode)
+    chat_system.conversation.verbose = False
+
+    results = []
+    for turn in range(1, turns + 1):
+        user_input = f"第{turn}个问题：请解释一下这个步骤应该怎么做，以及需要注意哪些细节？"
+        prompt_tokens = estimate_tokens(chat_system.build_prompt(user_input))
+
+        chat_system.conversation.predict(input=user_input)
+        summary_tokens = 0
+        memory = chat_system.memory
+        if isinstance(memory, SummaryWindowMemory):
+            overflow, _ = memory._split_overflow()
+            if overflow:
+                summary_tokens = estimate_tokens(SUMMARY_PROMPT.format(
+                    summary=memory.summary or "无", new_lines=get_buffer_string(overflow)))
+            memory.prune()
+        results.append((prompt_tokens, summary_tokens))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多轮对话记忆模式的提示词token对比")
+    parser.add_argument("--turns", type=int, default=100, help="对话轮数")
+    args = parser.parse_args()
+
+    buffer_results = run("buffer", args.turns)
+    window_results = run("window", args.turns)
+
+    print(f"{'轮次':>4} | {'buffer':>8} | {'window':>8} | {'window摘要':>10}")
+    for turn in range(args.turns):
+        if (turn + 1) % 10 == 0 or turn == 0:
+            print(f"{turn + 1:>6} | {buffer_results[turn][0]:>8} | "
+                  f"{window_results[turn][0]:>8} | {window_results[turn][1]:>12}")
+
+    buffer_total = sum(tokens for tokens, _ in buffer_results)
+    window_total = sum(tokens + summary for tokens, summary in window_results)
+    print("-" * 44)
+    print(f"buffer 累计提示词token: {buffer_total}")
+    print(f"window 累计提示词token（含摘要调用）: {window_total}")
@@ -0,0 +1,51 @@
+"""
+会话创建耗时基准测试
+对比每个会话单独创建模型客户端（旧方式）与共享模型客户端（新方式）时，
+创建 ChatSystem 的平均耗时和内存占用。不会发起任何模型请求。
+使用方法：
+    python bench_session_creation.py --sessions 200
+    python bench_session_creation.py --sessions 200 --deepseek
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from chatwith_API import ChatSystem, create_llm, get_shared_llm
+
+
+def bench(label: str, sessions: int, api_key: str, use_ollama: bool, shared: bool):
+    """创建 sessions 个会话并打印平均耗时与内存增量"""
+    if shared:
+        # 预热：共享客户端只在第一个会话时创建
+        get_shared_llm(api_key, use_ollama)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    systems = []
+    for _ in range(sessions):
+        if shared:
+            systems.append(ChatSystem(api_key, use_ollama=use_ollama))
+        else:
+            systems.append(ChatSystem(api_key, use_ollama=use_ollama,
+                                      llm=create_llm(api_key, use_ollama)))
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<10} 会话数={sessions}  "
+          f"平均创建耗时={elapsed / sessions * 1000:.3f}ms  "
+          f"平均内存={current / sessions / 1024:.1f}KB")
+    return systems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChatSystem 创建耗时基准测试")
+    parser.add_argument("--sessions", type=int, default=200, help="创建的会话数")
+    parser.add_argument("--deepseek", action="store_true", help="使用DeepSeek模式（默认Ollama模式）")
+    args = parser.parse_args()
+
+    use_ollama = not args.deepseek
+    api_key = "bench-api-key"
+    bench("before", args.sessions, api_key, use_ollama, shared=False)
+    bench("after", args.sessions, api_key, use_ollama, shared=True)
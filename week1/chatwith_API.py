@@ -8,24 +8,72 @@ python-dotenv==1.0.0
 
 # chat_system.py
 import os
-from typing import List, Dict, Any, Optional
+import sys
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Tuple
 from dotenv import load_dotenv
-from langchain.llms.base import LLM
+from langchain.llms.base import LLM, BaseLLM
+from langchain.chat_models.base import BaseChatModel
 from langchain.schema import (
     BaseMessage,
     HumanMessage,
     AIMessage,
     SystemMessage
 )
+from langchain.schema.output import GenerationChunk
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationChain
 from langchain.prompts import PromptTemplate
-import requests
 import json
 
+from history_store import HistoryStore, InMemoryHistoryStore, StoreChatMessageHistory
+from window_memory import SummaryWindowMemory
+from response_cache import ResponseCache
+from deepseek_client import (
+    DeepSeekAPIError,
+    post_json,
+    apost_json,
+    stream_lines,
+    astream_lines,
+)
+
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 仍为同步实现的调用放入有界线程池执行，避免阻塞事件循环
+_sync_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_SYNC_WORKERS", "8")),
+    thread_name_prefix="chat-sync"
+)
+
+# window 模式的记忆摘要在回复返回后于后台执行；同步调用的摘要放在这个独立的小线程池中，
+# 不占用对话请求使用的线程池
+_summary_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_SUMMARY_WORKERS", "2")),
+    thread_name_prefix="chat-summary"
+)
+# 进行中的异步摘要任务，保留引用以免任务完成前被回收
+_summary_tasks: set = set()
+
+async def run_in_sync_pool(func: Callable, *args: Any) -> Any:
+    """在有界线程池中执行同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sync_pool, func, *args)
+
+async def iterate_in_sync_pool(iterator: Iterator[str]) -> AsyncIterator[str]:
+    """在有界线程池中逐项消费同步迭代器"""
+    sentinel = object()
+    while True:
+        item = await run_in_sync_pool(next, iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
 class DeepSeekLLM(LLM):
     """自定义DeepSeek LLM包装器"""
     
@@ -67,74 +115,232 @@ class DeepSeekLLM(LLM):
     def _llm_type(self) -> str:
         return "deepseek"
     
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        """调用DeepSeek API"""
-        headers = {
+    def _build_headers(self) -> Dict[str, str]:
+        """构造请求头"""
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        data = {
+
+    def _build_payload(self, prompt: str, stream: bool) -> Dict[str, Any]:
+        """构造请求体"""
+        return {
             "model": self.model_name,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
-            "stream": False
+            "stream": stream
         }
-        
+
+    @staticmethod
+    def _parse_stream_line(line: str) -> Tuple[bool, Optional[str]]:
+        """
+        解析一行SSE数据
+        Returns:
+            (是否结束, token)；非数据行返回 (False, None)
+        """
+        # SSE格式: "data: {...}"，以 "data: [DONE]" 结束
+        if not line or not line.startswith("data:"):
+            return False, None
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return True, None
+        delta = json.loads(payload)["choices"][0].get("delta", {})
+        return False, delta.get("content")
+
+    @property
+    def _completions_url(self) -> str:
+        return f"{self.api_base}/chat/completions"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        """
+        调用DeepSeek API
+        使用共享连接池并自动重试，失败时抛出 DeepSeekAPIError
+        """
+        result = post_json(
+            self._completions_url,
+            self._build_headers(),
+            self._build_payload(prompt, stream=False)
+        )
         try:
-            response = requests.post(
-                f"{self.api_base}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
             return result["choices"][0]["message"]["content"]
-        
-        except Exception as e:
-            return f"API调用错误: {str(e)}"
+        except (KeyError, IndexError) as e:
+            raise DeepSeekAPIError(f"DeepSeek API响应格式错误: {e}") from e
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs: Any) -> str:
+        """异步调用DeepSeek API（使用共享连接池，不阻塞事件循环）"""
+        result = await apost_json(
+            self._completions_url,
+            self._build_headers(),
+            self._build_payload(prompt, stream=False)
+        )
+        try:
+            return result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError) as e:
+            raise DeepSeekAPIError(f"DeepSeek API响应格式错误: {e}") from e
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        """流式调用DeepSeek API，按SSE事件逐段返回生成的token"""
+        lines = stream_lines(
+            self._completions_url,
+            self._build_headers(),
+            self._build_payload(prompt, stream=True)
+        )
+        for line in lines:
+            done, token = self._parse_stream_line(line)
+            if done:
+                break
+            if token:
+                chunk = GenerationChunk(text=token)
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        """异步流式调用DeepSeek API"""
+        lines = astream_lines(
+            self._completions_url,
+            self._build_headers(),
+            self._build_payload(prompt, stream=True)
+        )
+        async for line in lines:
+            done, token = self._parse_stream_line(line)
+            if done:
+                break
+            if token:
+                chunk = GenerationChunk(text=token)
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+# 对话模板不可变，所有会话共用
+CONVERSATION_PROMPT = PromptTemplate(
+    input_variables=["history", "input"],
+    template="""你是一个有用的AI助手。
+            请根据对话历史和用户当前的问题，给出准确、有帮助的回答。
+            对话历史:
+            {history}
+            用户: {input}
+            助手: """
+)
+
+# 单轮对话（ChatModel）使用的系统提示词
+SINGLE_TURN_SYSTEM_PROMPT = "你是一个有帮助的AI助手。"
+
+# 多轮对话的记忆模式：buffer 发送全部历史，window 只发送最近若干轮原文 + 滚动摘要
+MEMORY_MODES = ("buffer", "window")
+DEFAULT_MEMORY_MODE = os.getenv("CHAT_MEMORY_MODE", "buffer")
+MEMORY_WINDOW_TURNS = int(os.getenv("CHAT_MEMORY_WINDOW_TURNS", "6"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "2000"))
+
+# 进程内共享的模型客户端：键为模型配置，值为客户端实例
+_llm_registry: Dict[Tuple, Any] = {}
+_llm_registry_lock = threading.Lock()
+
+def create_llm(api_key: str, use_ollama: bool = True) -> Any:
+    """
+    创建一个新的模型客户端（不经过共享注册表）
+    Args:
+        api_key: API密钥（用于DeepSeek模式）
+        use_ollama: 是否使用Ollama模式
+    Returns:
+        ChatOllama 或 DeepSeekLLM 实例
+    """
+    if use_ollama:
+        # 使用Ollama模式
+        from langchain_community.chat_models import ChatOllama
+        # 从环境变量获取 Ollama base_url
+        ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        return ChatOllama(
+            base_url=ollama_base_url,
+            model="deepseek-r1:14b",
+            temperature=0.7,
+        )
+    # 使用DeepSeek模式
+    return DeepSeekLLM(api_key=api_key)
+
+def get_shared_llm(api_key: str, use_ollama: bool = True) -> Any:
+    """
+    获取按配置共享的模型客户端，同一配置在进程内只创建一次
+    客户端本身无会话状态（HTTP连接池线程安全），可被所有会话并发使用
+    """
+    if use_ollama:
+        key: Tuple = ("ollama", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"), "deepseek-r1:14b")
+    else:
+        key = ("deepseek", api_key)
+    llm = _llm_registry.get(key)
+    if llm is None:
+        with _llm_registry_lock:
+            llm = _llm_registry.get(key)
+            if llm is None:
+                llm = create_llm(api_key, use_ollama)
+                _llm_registry[key] = llm
+    return llm
 
 class ChatSystem:
     """对话系统主类"""
     
-    def __init__(self, api_key: str, use_ollama: bool = True):
+    def __init__(self, api_key: str, use_ollama: bool = True, llm: Any = None,
+                 session_id: str = "default", store: Optional[HistoryStore] = None,
+                 memory_mode: Optional[str] = None,
+                 response_cache: Optional[ResponseCache] = None):
         """
         初始化聊天系统
         Args:
             api_key: API密钥（用于DeepSeek模式）
             use_ollama: 是否使用Ollama模式，默认False使用DeepSeek模式
+            llm: 指定使用的模型客户端，默认从共享注册表获取
+            session_id: 会话ID，作为存储中记忆和历史的键
+            store: 记忆和历史的存储，默认使用本实例私有的内存存储
+            memory_mode: 记忆模式（buffer/window），默认取 CHAT_MEMORY_MODE
+            response_cache: 单轮对话的响应缓存，为None时不缓存
         """
-        if use_ollama:
-            # 使用Ollama模式
-            from langchain_community.chat_models import ChatOllama
-            # 从环境变量获取 Ollama base_url
-            ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-            self.llm = ChatOllama(
-                base_url=ollama_base_url,
-                model="deepseek-r1:14b",
-                temperature=0.7,
-            )
-        else:
-            # 使用DeepSeek模式
-            self.llm = DeepSeekLLM(api_key=api_key)
+        self.response_cache = response_cache
+        self.session_id = session_id
+        self.store = store if store is not None else InMemoryHistoryStore()
+        # 对话内容的内存占用估算（字节），随每轮对话累加，避免每次请求重新遍历全部历史
+        self._history_bytes = 0
+        self._memory_bytes = 0
+        self._usage_lock = threading.Lock()
+        # 是否已有后台摘要在排队或进行中
+        self._prune_pending = False
+        self._prune_lock = threading.Lock()
+
+        # 会话只持有自己的记忆和历史，模型客户端在会话之间共享
+        self.llm = llm if llm is not None else get_shared_llm(api_key, use_ollama)
         
         # 创建对话模板
-        self.prompt_template = PromptTemplate(
-            input_variables=["history", "input"],
-            template="""你是一个有用的AI助手。
-            请根据对话历史和用户当前的问题，给出准确、有帮助的回答。
-            对话历史:
-            {history}
-            用户: {input}
-            助手: """
-        )
-        
-        # 初始化记忆
-        self.memory = ConversationBufferMemory(return_messages=True)
+        self.prompt_template = CONVERSATION_PROMPT
         
+        # 初始化记忆与对话链
+        self.set_memory_mode(memory_mode or DEFAULT_MEMORY_MODE)
+
+    def set_memory_mode(self, memory_mode: str):
+        """
+        切换本会话的记忆模式
+        Args:
+            memory_mode: buffer 保留全部历史；window 保留最近若干轮原文，更早的对话折叠为摘要
+        """
+        if memory_mode not in MEMORY_MODES:
+            raise ValueError(f"不支持的记忆模式: {memory_mode}，可选: {', '.join(MEMORY_MODES)}")
+        self.memory_mode = memory_mode
+
+        # 记忆消息保存在存储中，多个进程可共享同一会话的上下文
+        chat_memory = StoreChatMessageHistory(self.store, self.session_id)
+        if memory_mode == "window":
+            self.memory = SummaryWindowMemory(
+                llm=self.llm,
+                chat_memory=chat_memory,
+                window_turns=MEMORY_WINDOW_TURNS,
+                token_budget=MEMORY_TOKEN_BUDGET,
+                return_messages=True
+            )
+        else:
+            self.memory = ConversationBufferMemory(chat_memory=chat_memory, return_messages=True)
+
         # 创建对话链
         self.conversation = ConversationChain(
             llm=self.llm,
@@ -142,26 +348,32 @@ class ChatSystem:
             memory=self.memory,
             verbose=True
         )
-        
-        # 存储对话历史
-        self.chat_history: List[Dict[str, str]] = []
+
+    def build_prompt(self, user_input: str) -> str:
+        """根据当前记忆构造多轮对话发送给模型的完整提示词"""
+        history = self.memory.load_memory_variables({})["history"]
+        return self.prompt_template.format(history=history, input=user_input)
     
-    def single_turn_chat(self, user_input: str) -> str:
+    def single_turn_chat(self, user_input: str, force_cache: bool = False) -> str:
         """单轮对话 - 不保存历史记录"""
+        cache_key = self._cache_key(user_input, force_cache)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         try:
             if isinstance(self.llm, DeepSeekLLM):
                 # DeepSeek模式直接返回字符串
-                return self.llm._call(user_input)
+                response = self.llm._call(user_input)
             else:
                 # 对于 ChatOllama，使用标准的消息格式
-                messages = [
-                    SystemMessage(content="你是一个有帮助的AI助手。"),
-                    HumanMessage(content=user_input)
-                ]
-                ai_message = self.llm(messages)  # 返回 AIMessage 对象
-                return str(ai_message.content)  # 确保返回字符串
+                ai_message = self.llm(self._single_turn_messages(user_input))  # 返回 AIMessage 对象
+                response = str(ai_message.content)  # 确保返回字符串
+        except DeepSeekAPIError:
+            raise
         except Exception as e:
             return f"单轮对话出错: {str(e)}"
+        self._cache_set(cache_key, response)
+        return response
     
     def multi_turn_chat(self, user_input: str) -> str:
         """多轮对话 - 保存历史记录"""
@@ -170,25 +382,333 @@ class ChatSystem:
             response = self.conversation.predict(input=user_input)
             
             # 保存到历史记录
-            self.chat_history.append({
-                "user": user_input,
-                "assistant": response,
-                "timestamp": self._get_timestamp()
-            })
+            self._record_turn(user_input, response)
+            self._schedule_prune()
             
             return response
+        except DeepSeekAPIError:
+            raise
         except Exception as e:
             return f"多轮对话出错: {str(e)}"
     
-    def get_chat_history(self) -> List[Dict[str, str]]:
-        """获取对话历史"""
-        return self.chat_history
+    def stream_single_turn_chat(self, user_input: str, force_cache: bool = False) -> Iterator[str]:
+        """单轮对话（流式） - 逐个返回生成的token，不保存历史记录"""
+        cache_key = self._cache_key(user_input, force_cache)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        if isinstance(self.llm, DeepSeekLLM):
+            source = self.llm.stream(user_input)
+        else:
+            source = self.llm.stream(self._single_turn_messages(user_input))
+        tokens: List[str] = []
+        for chunk in source:
+            token = self._chunk_text(chunk)
+            if token:
+                tokens.append(token)
+                yield token
+        self._cache_set(cache_key, "".join(tokens))
+
+    def stream_multi_turn_chat(self, user_input: str) -> Iterator[str]:
+        """
+        多轮对话（流式） - 逐个返回生成的token
+        只有在整个回复生成完毕后才写入记忆和历史记录，
+        中途出错或客户端断开时不会留下半截回复。
+        """
+        prompt = self.build_prompt(user_input)
+
+        tokens: List[str] = []
+        for chunk in self.llm.stream(prompt):
+            token = self._chunk_text(chunk)
+            if token:
+                tokens.append(token)
+                yield token
+
+        self._save_turn(user_input, "".join(tokens))
+        self._schedule_prune()
+
+    async def asingle_turn_chat(self, user_input: str, force_cache: bool = False) -> str:
+        """单轮对话（异步）"""
+        if not self._supports_native_async():
+            return await run_in_sync_pool(self.single_turn_chat, user_input, force_cache)
+        cache_key = self._cache_key(user_input, force_cache)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            if isinstance(self.llm, DeepSeekLLM):
+                response = await self.llm.ainvoke(user_input)
+            else:
+                ai_message = await self.llm.ainvoke(self._single_turn_messages(user_input))
+                response = str(ai_message.content)
+        except DeepSeekAPIError:
+            raise
+        except Exception as e:
+            return f"单轮对话出错: {str(e)}"
+        self._cache_set(cache_key, response)
+        return response
+
+    async def amulti_turn_chat(self, user_input: str) -> str:
+        """多轮对话（异步），读写记忆和历史的存储调用不在事件循环中执行"""
+        if not self._supports_native_async():
+            return await run_in_sync_pool(self.multi_turn_chat, user_input)
+        try:
+            prompt = await self._run_store(self.build_prompt, user_input)
+            response = self._chunk_text(await self.llm.ainvoke(prompt))
+
+            await self._run_store(self._save_turn, user_input, response)
+            self._schedule_aprune()
+
+            return response
+        except DeepSeekAPIError:
+            raise
+        except Exception as e:
+            return f"多轮对话出错: {str(e)}"
+
+    async def astream_single_turn_chat(self, user_input: str,
+                                       force_cache: bool = False) -> AsyncIterator[str]:
+        """单轮对话（异步流式）"""
+        if not self._supports_native_async():
+            tokens = self.stream_single_turn_chat(user_input, force_cache)
+            async for token in iterate_in_sync_pool(tokens):
+                yield token
+            return
+        cache_key = self._cache_key(user_input, force_cache)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        if isinstance(self.llm, DeepSeekLLM):
+            source = self.llm.astream(user_input)
+        else:
+            source = self.llm.astream(self._single_turn_messages(user_input))
+        collected: List[str] = []
+        async for chunk in source:
+            token = self._chunk_text(chunk)
+            if token:
+                collected.append(token)
+                yield token
+        self._cache_set(cache_key, "".join(collected))
+
+    async def astream_multi_turn_chat(self, user_input: str) -> AsyncIterator[str]:
+        """多轮对话（异步流式），回复完整生成后才写入记忆和历史记录"""
+        if not self._supports_native_async():
+            async for token in iterate_in_sync_pool(self.stream_multi_turn_chat(user_input)):
+                yield token
+            return
+        prompt = await self._run_store(self.build_prompt, user_input)
+
+        tokens: List[str] = []
+        async for chunk in self.llm.astream(prompt):
+            token = self._chunk_text(chunk)
+            if token:
+                tokens.append(token)
+                yield token
+
+        await self._run_store(self._save_turn, user_input, "".join(tokens))
+        self._schedule_aprune()
+
+    @property
+    def chat_history(self) -> List[Dict[str, Any]]:
+        """对话历史（从存储读取）"""
+        return self.store.get_turns(self.session_id)
+
+    def get_chat_history(self, after: Optional[int] = None,
+                         limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取对话历史
+        Args:
+            after: 只返回id大于该值的轮次（增量获取）
+            limit: 最多返回的轮数
+        """
+        return self.store.get_turns(self.session_id, after=after, limit=limit)
+
+    def history_version(self) -> Tuple[int, int]:
+        """返回 (轮数, 最新一轮的id)，历史有任何变化（新增或清空）时都会改变"""
+        return self.store.turn_stats(self.session_id)
+
+    async def aget_chat_history(self, after: Optional[int] = None,
+                                limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取对话历史（异步）"""
+        return await self._run_store(self.get_chat_history, after, limit)
+
+    async def ahistory_version(self) -> Tuple[int, int]:
+        """返回 (轮数, 最新一轮的id)（异步）"""
+        return await self._run_store(self.history_version)
+
+    async def aclear_history(self):
+        """清空对话历史（异步）"""
+        await self._run_store(self.clear_history)
     
     def clear_history(self):
-        """清空对话历史"""
-        self.memory.clear()
-        self.chat_history.clear()
-    
+        """清空对话历史（记忆与历史在同一存储中，一并清除）"""
+        self.store.clear(self.session_id)
+        with self._usage_lock:
+            self._history_bytes = self._memory_bytes = 0
+
+    def release(self):
+        """
+        会话被淘汰时调用
+        非持久存储中的数据随之删除；持久存储保留，其他进程或之后的请求仍可继续该会话
+        """
+        if not self.store.persistent:
+            self.store.clear(self.session_id)
+
+    def _schedule_prune(self):
+        """window 模式下在后台把滑出窗口的旧对话折叠进摘要，不延迟本轮回复"""
+        if self._claim_prune():
+            _summary_pool.submit(self._prune_memory, self.memory)
+
+    def _schedule_aprune(self):
+        """window 模式下创建后台任务把滑出窗口的旧对话折叠进摘要（异步）"""
+        if self._claim_prune():
+            task = asyncio.create_task(self._aprune_memory(self.memory))
+            _summary_tasks.add(task)
+            task.add_done_callback(_summary_tasks.discard)
+
+    def _claim_prune(self) -> bool:
+        """
+        同一会话同时只进行一次摘要，摘要进行中新滑出窗口的消息留到下一轮一并折叠
+        Returns:
+            bool: 是否需要由调用方启动摘要
+        """
+        if not isinstance(self.memory, SummaryWindowMemory):
+            return False
+        with self._prune_lock:
+            if self._prune_pending:
+                return False
+            self._prune_pending = True
+            return True
+
+    def _prune_memory(self, memory: SummaryWindowMemory):
+        """生成摘要并折叠旧消息，失败时只记录日志，旧消息保留到下一轮再折叠"""
+        try:
+            memory.prune()
+            self._recount_memory_bytes()
+        except Exception:
+            logger.exception("会话记忆摘要失败")
+        finally:
+            self._prune_pending = False
+
+    async def _aprune_memory(self, memory: SummaryWindowMemory):
+        """生成摘要并折叠旧消息（异步），失败时只记录日志"""
+        try:
+            plan = await self._run_store(memory.plan_prune)
+            if plan is not None:
+                overflow, prompt = plan
+                summary = self._chunk_text(await memory.llm.ainvoke(prompt))
+                await self._run_store(memory.commit_prune, overflow, summary)
+                await self._run_store(self._recount_memory_bytes)
+        except Exception:
+            logger.exception("会话记忆摘要失败")
+        finally:
+            self._prune_pending = False
+
+    async def _run_store(self, func: Callable, *args: Any) -> Any:
+        """
+        执行读写存储的同步函数
+        持久存储（SQLite）有磁盘I/O和写锁等待，放入有界线程池执行，不阻塞事件循环；
+        内存存储直接调用
+        """
+        if self.store.persistent:
+            return await run_in_sync_pool(func, *args)
+        return func(*args)
+
+    def _save_turn(self, user_input: str, response: str) -> int:
+        """把一轮完整的对话写入记忆和历史记录，返回该轮的id"""
+        self.memory.save_context({"input": user_input}, {"response": response})
+        return self._record_turn(user_input, response)
+
+    def _record_turn(self, user_input: str, response: str) -> int:
+        """保存一轮对话历史，返回该轮的id"""
+        turn = {
+            "user": user_input,
+            "assistant": response,
+            "timestamp": self._get_timestamp()
+        }
+        turn_id = self.store.append_turn(self.session_id, turn)
+        if not self.store.persistent:
+            with self._usage_lock:
+                self._history_bytes += sys.getsizeof(turn_id) + sum(sys.getsizeof(value) for value in turn.values())
+                # 本轮的问题和回复同时写入了记忆消息
+                self._memory_bytes += sys.getsizeof(user_input) + sys.getsizeof(response)
+        return turn_id
+
+    def _recount_memory_bytes(self):
+        """window 模式裁剪记忆后重新统计记忆消息和摘要的大小（只涉及窗口内的消息）"""
+        if self.store.persistent:
+            return
+        size = sum(sys.getsizeof(message.content) for message in self.memory.chat_memory.messages)
+        size += sys.getsizeof(self.store.get_summary(self.session_id))
+        with self._usage_lock:
+            self._memory_bytes = size
+
+    def estimate_memory_bytes(self) -> int:
+        """
+        估算本会话对话内容占用的内存（字节）
+        只统计历史记录和记忆中的文本，不含模型客户端等共享对象；
+        持久存储的数据不在进程内存中，计为0
+        """
+        if self.store.persistent:
+            return 0
+        with self._usage_lock:
+            return self._history_bytes + self._memory_bytes
+
+    @staticmethod
+    def _single_turn_messages(user_input: str) -> List[BaseMessage]:
+        """单轮对话发送给ChatModel的消息"""
+        return [
+            SystemMessage(content=SINGLE_TURN_SYSTEM_PROMPT),
+            HumanMessage(content=user_input)
+        ]
+
+    def _cache_key(self, user_input: str, force_cache: bool) -> Optional[str]:
+        """
+        计算单轮对话的缓存键
+        未启用缓存，或温度大于0且未强制使用缓存时返回None
+        """
+        if self.response_cache is None:
+            return None
+        if isinstance(self.llm, DeepSeekLLM):
+            backend, model, system_prompt = "deepseek", self.llm.model_name, ""
+        else:
+            backend = type(self.llm).__name__
+            model = getattr(self.llm, "model", "")
+            system_prompt = SINGLE_TURN_SYSTEM_PROMPT
+        return self.response_cache.make_key(
+            backend, model, getattr(self.llm, "temperature", None),
+            system_prompt, user_input, force=force_cache
+        )
+
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[str]:
+        """查询缓存"""
+        if cache_key is None:
+            return None
+        return self.response_cache.get(cache_key)
+
+    def _cache_set(self, cache_key: Optional[str], response: str):
+        """写入缓存（空回复不缓存）"""
+        if cache_key is not None and response:
+            self.response_cache.set(cache_key, response)
+
+    def _supports_native_async(self) -> bool:
+        """
+        判断当前模型是否实现了原生异步调用
+        未实现时langchain会退回到默认线程池，这里改为走有界线程池
+        """
+        if isinstance(self.llm, DeepSeekLLM):
+            return True
+        base = BaseChatModel if isinstance(self.llm, BaseChatModel) else BaseLLM
+        return type(self.llm)._agenerate is not base._agenerate
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """统一LLM（返回str）与ChatModel（返回消息块）的流式输出"""
+        if isinstance(chunk, str):
+            return chunk
+        return str(chunk.content)
+
     def _get_timestamp(self) -> str:
         """获取时间戳"""
         from datetime import datetime
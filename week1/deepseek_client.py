@@ -0,0 +1,229 @@
+"""
+DeepSeek HTTP 客户端
+进程内共享连接池（HTTP keep-alive），对 429/5xx/超时做带抖动的指数退避重试，
+每个请求有总截止时间，失败时抛出带类型的异常而不是返回错误字符串。
+"""
+
+import os
+import time
+import random
+import asyncio
+from typing import Any, Dict, Iterator, AsyncIterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+import httpx
+
+# 连接池大小与重试策略，均可通过环境变量配置
+MAX_CONNECTIONS = int(os.getenv("CHAT_HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("CHAT_HTTP_MAX_KEEPALIVE", "10"))
+MAX_RETRIES = int(os.getenv("DEEPSEEK_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("DEEPSEEK_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("DEEPSEEK_BACKOFF_MAX", "8"))
+REQUEST_TIMEOUT = float(os.getenv("DEEPSEEK_TIMEOUT", "30"))
+REQUEST_DEADLINE = float(os.getenv("DEEPSEEK_DEADLINE", "60"))
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class DeepSeekAPIError(Exception):
+    """DeepSeek API调用失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DeepSeekRateLimitError(DeepSeekAPIError):
+    """触发限流（429）且重试后仍未恢复"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=429)
+        self.retry_after = retry_after
+
+
+class DeepSeekTimeoutError(DeepSeekAPIError):
+    """请求超时或超过总截止时间"""
+
+
+_session: Optional[requests.Session] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_session() -> requests.Session:
+    """获取共享的同步HTTP会话（连接池复用TCP+TLS连接）"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取共享的异步HTTP客户端"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE
+            )
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """关闭共享的异步HTTP客户端（应用关闭时调用）"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """计算第attempt次重试前的等待时间（full jitter），优先遵循Retry-After"""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """解析Retry-After响应头（秒数形式）"""
+    value = headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _status_error(status_code: int, body: str, retry_after: Optional[float] = None) -> DeepSeekAPIError:
+    """根据状态码构造对应的异常"""
+    message = f"DeepSeek API返回 {status_code}: {body[:200]}"
+    if status_code == 429:
+        return DeepSeekRateLimitError(message, retry_after=retry_after)
+    return DeepSeekAPIError(message, status_code=status_code)
+
+
+def _remaining(deadline: float) -> float:
+    """距离截止时间的剩余秒数，已超时则抛出异常"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeepSeekTimeoutError("DeepSeek API请求超过截止时间")
+    return remaining
+
+
+def _open(url: str, headers: Dict[str, str], payload: Dict[str, Any], stream: bool,
+          deadline: Optional[float] = None) -> requests.Response:
+    """发送同步请求，失败时按策略重试，返回状态正常的响应"""
+    deadline_at = time.monotonic() + (deadline or REQUEST_DEADLINE)
+    attempt = 0
+    while True:
+        timeout = min(REQUEST_TIMEOUT, _remaining(deadline_at))
+        try:
+            response = get_session().post(url, headers=headers, json=payload,
+                                          timeout=timeout, stream=stream)
+        except requests.Timeout as e:
+            error: DeepSeekAPIError = DeepSeekTimeoutError(f"DeepSeek API请求超时: {e}")
+            wait = _backoff_delay(attempt)
+        except requests.ConnectionError as e:
+            error = DeepSeekAPIError(f"DeepSeek API连接失败: {e}")
+            wait = _backoff_delay(attempt)
+        else:
+            if response.status_code < 400:
+                return response
+            retry_after = _retry_after(response.headers)
+            error = _status_error(response.status_code, response.text, retry_after)
+            response.close()
+            if response.status_code not in RETRYABLE_STATUS:
+                raise error
+            wait = _backoff_delay(attempt, retry_after)
+
+        attempt += 1
+        if attempt > MAX_RETRIES or wait >= deadline_at - time.monotonic():
+            raise error
+        time.sleep(wait)
+
+
+async def _aopen(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                 deadline: Optional[float] = None) -> httpx.Response:
+    """发送异步请求（以流方式打开），失败时按策略重试，返回状态正常的响应"""
+    client = get_async_client()
+    deadline_at = time.monotonic() + (deadline or REQUEST_DEADLINE)
+    attempt = 0
+    while True:
+        timeout = min(REQUEST_TIMEOUT, _remaining(deadline_at))
+        request = client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TimeoutException as e:
+            error: DeepSeekAPIError = DeepSeekTimeoutError(f"DeepSeek API请求超时: {e}")
+            wait = _backoff_delay(attempt)
+        except httpx.TransportError as e:
+            error = DeepSeekAPIError(f"DeepSeek API连接失败: {e}")
+            wait = _backoff_delay(attempt)
+        else:
+            if response.status_code < 400:
+                return response
+            body = (await response.aread()).decode("utf-8", errors="replace")
+            retry_after = _retry_after(response.headers)
+            error = _status_error(response.status_code, body, retry_after)
+            await response.aclose()
+            if response.status_code not in RETRYABLE_STATUS:
+                raise error
+            wait = _backoff_delay(attempt, retry_after)
+
+        attempt += 1
+        if attempt > MAX_RETRIES or wait >= deadline_at - time.monotonic():
+            raise error
+        await asyncio.sleep(wait)
+
+
+def post_json(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+              deadline: Optional[float] = None) -> Dict[str, Any]:
+    """同步POST并返回JSON结果"""
+    response = _open(url, headers, payload, stream=False, deadline=deadline)
+    return response.json()
+
+
+async def apost_json(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                     deadline: Optional[float] = None) -> Dict[str, Any]:
+    """异步POST并返回JSON结果"""
+    response = await _aopen(url, headers, payload, deadline=deadline)
+    try:
+        await response.aread()
+        return response.json()
+    finally:
+        await response.aclose()
+
+
+def stream_lines(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                 deadline: Optional[float] = None) -> Iterator[str]:
+    """
+    同步流式POST，逐行返回响应内容
+    只在收到响应头之前重试，已经开始输出后不再重试，避免重复token
+    """
+    response = _open(url, headers, payload, stream=True, deadline=deadline)
+    with response:
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                yield line
+        except requests.RequestException as e:
+            raise DeepSeekAPIError(f"DeepSeek API流式响应中断: {e}") from e
+
+
+async def astream_lines(url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                        deadline: Optional[float] = None) -> AsyncIterator[str]:
+    """异步流式POST，逐行返回响应内容"""
+    response = await _aopen(url, headers, payload, deadline=deadline)
+    try:
+        async for line in response.aiter_lines():
+            yield line
+    except httpx.HTTPError as e:
+        raise DeepSeekAPIError(f"DeepSeek API流式响应中断: {e}") from e
+    finally:
+        await response.aclose()
@@ -4,14 +4,28 @@ FastAPI 聊天应用服务器
 启动命令：uvicorn fast_app:app --reload --host 0.0.0.0 --port 5000
 """
 
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import RedirectResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles  # 用于服务静态文件
 import uuid  # 用于生成唯一会话ID
+import asyncio
+import json
+import hmac
+import hashlib
 import os
+from typing import AsyncIterator, Optional
 
-from chatwith_API import ChatSystem  # 导入聊天系统核心类
+from chatwith_API import ChatSystem, run_in_sync_pool  # 导入聊天系统核心类
+from session_manager import SessionManager
+from history_store import create_history_store
+from response_cache import create_response_cache
+from assets import AssetManifest, TemplateSet
+from deepseek_client import (
+    DeepSeekAPIError,
+    DeepSeekRateLimitError,
+    DeepSeekTimeoutError,
+    close_async_client,
+)
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -20,21 +34,48 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 设置静态文件目录
-# 静态文件目录用于存放CSS、JavaScript等静态资源
-app.mount("/static", StaticFiles(directory="static"), name="static")
-# 模板文件目录
-from fastapi.templating import Jinja2Templates
-templates = Jinja2Templates(directory="templates")
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """
+    应用关闭时释放共享的HTTP连接池，并停止过期会话清理任务
+    """
+    task = getattr(app.state, "history_purge_task", None)
+    if task is not None:
+        task.cancel()
+    await close_async_client()
 
-@app.get("/{full_path:path}")
-async def serve_templates(full_path: str):
+@app.exception_handler(DeepSeekAPIError)
+async def deepseek_error_handler(request: Request, exc: DeepSeekAPIError):
     """
-    服务模板文件
+    将上游模型服务的错误转换为对应的HTTP状态码
+    限流 -> 429（附带Retry-After），超时 -> 504，其他 -> 502
     """
-    if not full_path:
-        full_path = "index.html"
-    return FileResponse(f"templates/{full_path}", media_type="text/html")
+    headers = {}
+    if isinstance(exc, DeepSeekRateLimitError):
+        status_code = 429
+        if exc.retry_after is not None:
+            headers["Retry-After"] = str(int(exc.retry_after))
+    elif isinstance(exc, DeepSeekTimeoutError):
+        status_code = 504
+    else:
+        status_code = 502
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": str(exc)},
+        headers=headers
+    )
+
+# 静态资源与模板：启动时计算内容指纹并预压缩（gzip/br），
+# 带指纹的静态资源长期缓存，页面模板每次通过ETag验证
+static_assets = AssetManifest("static")
+page_templates = TemplateSet("templates", static_assets)
+
+@app.get("/static/{path:path}")
+async def serve_static(request: Request, path: str):
+    """
+    服务静态资源（CSS、JavaScript等）
+    """
+    return static_assets.serve(request, path)
 
 # 配置CORS（跨源资源共享）
 app.add_middleware(
@@ -51,9 +92,66 @@ app.add_middleware(
     max_age=3600  # 预检请求的缓存时间
 )
 
-# 用字典存储所有用户的会话实例
-# 键为会话ID，值为对应的ChatSystem实例
-chat_sessions = {}
+# 对话记忆与历史存储，CHAT_HISTORY_BACKEND=sqlite 时多个worker进程共享
+history_store = create_history_store()
+
+# 单轮对话响应缓存（CHAT_CACHE_ENABLED=1 时启用）
+response_cache = create_response_cache()
+
+def create_chat_system(session_id: str) -> ChatSystem:
+    """
+    为新会话创建聊天系统实例
+    Args:
+        session_id: 会话ID
+    Returns:
+        ChatSystem: 新的聊天系统实例
+    """
+    api_key = os.getenv('DEEPSEEK_API_KEY', 'your-deepseek-api-key')
+    return ChatSystem(api_key, session_id=session_id, store=history_store)
+
+# 有界的会话存储：超过上限按LRU淘汰，空闲超时自动过期
+session_manager = SessionManager(
+    factory=create_chat_system,
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "1000")),
+    idle_ttl=float(os.getenv("CHAT_SESSION_TTL", "1800")),
+    max_total_bytes=int(os.getenv("CHAT_SESSION_MAX_BYTES", "0"))
+)
+
+# 持久存储中的会话数据不随进程淘汰会话而删除（其他worker可能仍在使用），
+# 按此间隔（秒）统一删除最后写入超过 CHAT_SESSION_TTL 的会话，0 表示不清理
+history_purge_interval = float(os.getenv("CHAT_HISTORY_PURGE_INTERVAL", "300"))
+
+async def purge_idle_history():
+    """定期删除持久存储中空闲过期的会话数据"""
+    while True:
+        await asyncio.sleep(history_purge_interval)
+        try:
+            await run_in_sync_pool(history_store.purge_idle, session_manager.idle_ttl)
+        except Exception as e:
+            print(f"清理过期会话数据失败: {e}")
+
+@app.on_event("startup")
+async def start_history_purge():
+    """
+    应用启动时为持久存储启动过期会话清理任务
+    """
+    if history_store.persistent and session_manager.idle_ttl > 0 and history_purge_interval > 0:
+        app.state.history_purge_task = asyncio.create_task(purge_idle_history())
+
+# 管理接口（如 /metrics/sessions）需携带与之相同的 X-Admin-Token 请求头；未设置时管理接口不可用
+admin_token = os.getenv("CHAT_ADMIN_TOKEN")
+
+def require_admin(request: Request):
+    """
+    校验管理令牌
+    Raises:
+        HTTPException: 未配置 CHAT_ADMIN_TOKEN 或令牌不匹配时抛出403错误
+    """
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="未配置 CHAT_ADMIN_TOKEN，管理接口已禁用")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="无效的管理令牌")
 
 @app.get("/")
 async def root():
@@ -77,6 +175,23 @@ def get_session_id(request: Request) -> str:
         session_id = str(uuid.uuid4())
     return session_id
 
+def find_chat_system(request: Request) -> Optional[ChatSystem]:
+    """
+    查找请求对应的已有聊天系统实例（供只读接口使用，不创建空会话）
+    Args:
+        request: FastAPI请求对象
+    Returns:
+        Optional[ChatSystem]: 请求没有会话cookie或会话不存在时返回None
+    """
+    session_id = request.cookies.get("session_id")
+    if not session_id:
+        return None
+    chat_system = session_manager.get(session_id)
+    if chat_system is None and history_store.persistent:
+        # 会话可能由其他worker进程创建，数据在共享存储中，本进程按需加载
+        chat_system = session_manager.get_or_create(session_id)
+    return chat_system
+
 def get_chat_system(session_id: str) -> ChatSystem:
     """
     获取或创建聊天系统实例
@@ -85,10 +200,36 @@ def get_chat_system(session_id: str) -> ChatSystem:
     Returns:
         ChatSystem: 对应的聊天系统实例
     """
-    if session_id not in chat_sessions:
+    return session_manager.get_or_create(session_id)
+
+def apply_memory_mode(chat_system: ChatSystem, data: dict):
+    """
+    按请求中的 memory_mode 字段切换会话的记忆模式（可选字段）
+    Raises:
+        HTTPException: 记忆模式不合法时抛出400错误
+    """
+    memory_mode = data.get('memory_mode')
+    if memory_mode and memory_mode != chat_system.memory_mode:
+        try:
+            chat_system.set_memory_mode(memory_mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+# 单轮对话不依赖会话状态，所有请求共用一个实例，不占用会话存储
+_stateless_chat_system = None
+
+def get_stateless_chat_system() -> ChatSystem:
+    """
+    获取单轮对话共用的聊天系统实例
+    Returns:
+        ChatSystem: 共享的聊天系统实例
+    """
+    global _stateless_chat_system
+    if _stateless_chat_system is None:
         api_key = os.getenv('DEEPSEEK_API_KEY', 'your-deepseek-api-key')
-        chat_sessions[session_id] = ChatSystem(api_key)
-    return chat_sessions[session_id]
+        _stateless_chat_system = ChatSystem(api_key, session_id="stateless",
+                                            response_cache=response_cache)
+    return _stateless_chat_system
 
 @app.post("/chat")
 async def single_chat(request: Request):
@@ -96,7 +237,7 @@ async def single_chat(request: Request):
     单轮对话API端点
     每次对话都是独立的，不保存上下文
     Args:
-        request: FastAPI请求对象，包含用户消息
+        request: FastAPI请求对象，包含用户消息和可选的 force_cache（温度大于0时也使用缓存）
     Returns:
         dict: 包含AI响应和对话类型的字典
     Raises:
@@ -107,8 +248,8 @@ async def single_chat(request: Request):
     if not user_input:
         raise HTTPException(status_code=400, detail="消息不能为空")
     session_id = get_session_id(request)
-    chat_system = get_chat_system(session_id)
-    response = chat_system.single_turn_chat(user_input)
+    chat_system = get_stateless_chat_system()
+    response = await chat_system.asingle_turn_chat(user_input, bool(data.get('force_cache')))
     json_response = JSONResponse(content={"response": response, "type": "single"})
     json_response.set_cookie("session_id", session_id)
     return json_response
@@ -119,11 +260,11 @@ async def multi_chat(request: Request):
     多轮对话API端点
     保持对话上下文，支持连续对话
     Args:
-        request: FastAPI请求对象，包含用户消息
+        request: FastAPI请求对象，包含用户消息和可选的记忆模式 memory_mode（buffer/window）
     Returns:
         JSONResponse: 包含AI响应和对话类型的JSON响应
     Raises:
-        HTTPException: 当消息为空时抛出400错误
+        HTTPException: 当消息为空或记忆模式不合法时抛出400错误
     """
     data = await request.json()
     user_input = data.get('message', '')
@@ -131,25 +272,138 @@ async def multi_chat(request: Request):
         raise HTTPException(status_code=400, detail="消息不能为空")
     session_id = get_session_id(request)
     chat_system = get_chat_system(session_id)
-    response = chat_system.multi_turn_chat(user_input)
+    apply_memory_mode(chat_system, data)
+    response = await chat_system.amulti_turn_chat(user_input)
+    session_manager.enforce_memory_limit(session_id)
     json_response = JSONResponse(content={"response": response, "type": "multi"})
     json_response.set_cookie("session_id", session_id)
     return json_response
 
+def sse_event(payload: dict) -> str:
+    """
+    将字典编码为一条Server-Sent Events消息
+    Args:
+        payload: 要发送的数据
+    Returns:
+        str: 以空行结尾的 "data: {...}" SSE事件
+    """
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def sse_stream(tokens: AsyncIterator[str], chat_type: str,
+                     session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    把token迭代器包装为SSE事件流
+    每个token发送一个 {"token": ...} 事件，结束时发送 {"done": true}，
+    出错时发送 {"error": ...} 事件后结束
+    Args:
+        session_id: 多轮对话的会话ID，回复结束后更新该会话的内存占用
+    """
+    try:
+        async for token in tokens:
+            yield sse_event({"token": token})
+        if session_id is not None:
+            session_manager.enforce_memory_limit(session_id)
+        yield sse_event({"done": True, "type": chat_type})
+    except DeepSeekAPIError as e:
+        yield sse_event({"error": str(e), "status": e.status_code, "type": chat_type})
+    except Exception as e:
+        yield sse_event({"error": str(e), "type": chat_type})
+
+def streaming_response(tokens: AsyncIterator[str], chat_type: str, session_id: str) -> StreamingResponse:
+    """
+    创建SSE流式响应并设置会话cookie
+    """
+    response = StreamingResponse(
+        sse_stream(tokens, chat_type, session_id if chat_type == "multi" else None),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲，保证token及时送达
+        }
+    )
+    response.set_cookie("session_id", session_id)
+    return response
+
+@app.post("/chat/stream")
+async def single_chat_stream(request: Request):
+    """
+    单轮对话流式API端点
+    以Server-Sent Events逐个推送生成的token
+    Args:
+        request: FastAPI请求对象，包含用户消息和可选的 force_cache（温度大于0时也使用缓存）
+    Returns:
+        StreamingResponse: text/event-stream 格式的流式响应
+    Raises:
+        HTTPException: 当消息为空时抛出400错误
+    """
+    data = await request.json()
+    user_input = data.get('message', '')
+    if not user_input:
+        raise HTTPException(status_code=400, detail="消息不能为空")
+    session_id = get_session_id(request)
+    chat_system = get_stateless_chat_system()
+    tokens = chat_system.astream_single_turn_chat(user_input, bool(data.get('force_cache')))
+    return streaming_response(tokens, "single", session_id)
+
+@app.post("/multi_chat/stream")
+async def multi_chat_stream(request: Request):
+    """
+    多轮对话流式API端点
+    以Server-Sent Events逐个推送生成的token，回复完整生成后才写入对话记忆
+    Args:
+        request: FastAPI请求对象，包含用户消息和可选的记忆模式 memory_mode（buffer/window）
+    Returns:
+        StreamingResponse: text/event-stream 格式的流式响应
+    Raises:
+        HTTPException: 当消息为空或记忆模式不合法时抛出400错误
+    """
+    data = await request.json()
+    user_input = data.get('message', '')
+    if not user_input:
+        raise HTTPException(status_code=400, detail="消息不能为空")
+    session_id = get_session_id(request)
+    chat_system = get_chat_system(session_id)
+    apply_memory_mode(chat_system, data)
+    tokens = chat_system.astream_multi_turn_chat(user_input)
+    return streaming_response(tokens, "multi", session_id)
+
 @app.get("/history")
-async def get_history(request: Request):
+async def get_history(request: Request,
+                      after: Optional[int] = Query(None, ge=0, description="只返回id大于该值的轮次"),
+                      limit: Optional[int] = Query(None, ge=1, le=500, description="最多返回的轮数")):
     """
     获取对话历史API端点
-    返回当前会话的所有对话历史
+    支持游标分页（?after=<turn_id>&limit=N），前端只需获取增量；
+    响应带ETag，请求头 If-None-Match 与之相同时返回304
     Args:
         request: FastAPI请求对象
+        after: 游标，上一次获取到的最后一轮id
+        limit: 本次最多返回的轮数，不传则返回全部
     Returns:
-        JSONResponse: 包含对话历史的JSON响应
+        JSONResponse: 包含对话历史、下一页游标和是否还有更多的JSON响应
     """
     session_id = get_session_id(request)
-    chat_system = get_chat_system(session_id)
-    history = chat_system.get_chat_history()
-    json_response = JSONResponse(content={"history": history})
+    # 只读接口不为没有会话的请求创建新的ChatSystem
+    chat_system = find_chat_system(request)
+    count, last_id = await chat_system.ahistory_version() if chat_system else (0, 0)
+
+    # 历史的轮数和最新id在新增或清空时都会变化，据此生成ETag
+    version = f"{session_id}:{count}:{last_id}:{after}:{limit}"
+    etag = f'W/"{hashlib.sha1(version.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    history = await chat_system.aget_chat_history(after=after, limit=limit) if chat_system else []
+    next_after = history[-1]["id"] if history else (after or 0)
+    json_response = JSONResponse(
+        content={
+            "history": history,
+            "next_after": next_after,
+            "has_more": next_after < last_id
+        },
+        headers=headers
+    )
     json_response.set_cookie("session_id", session_id)
     return json_response
 
@@ -164,9 +418,39 @@ async def clear_history(request: Request):
         JSONResponse: 操作结果消息
     """
     session_id = get_session_id(request)
-    chat_system = get_chat_system(session_id)
-    chat_system.clear_history()
+    chat_system = find_chat_system(request)
+    if chat_system:
+        await chat_system.aclear_history()
+        session_manager.enforce_memory_limit(session_id)
     json_response = JSONResponse(content={"message": "对话历史已清空"})
     json_response.set_cookie("session_id", session_id)
     return json_response
 
+@app.get("/metrics/sessions")
+async def session_metrics(request: Request):
+    """
+    会话统计API端点（需要管理令牌）
+    返回活跃会话数、命中/未命中/淘汰次数以及内存占用估算的汇总，不包含会话ID
+    """
+    require_admin(request)
+    return JSONResponse(content=session_manager.metrics())
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """
+    响应缓存统计API端点
+    返回单轮对话缓存的命中/未命中/跳过次数和命中率
+    """
+    if response_cache is None:
+        return JSONResponse(content={"enabled": False})
+    return JSONResponse(content={"enabled": True, **response_cache.stats()})
+
+# 兜底路由必须最后注册，否则会遮蔽前面定义的GET接口（如 /history）
+@app.get("/{full_path:path}")
+async def serve_templates(request: Request, full_path: str):
+    """
+    服务模板文件
+    """
+    if not full_path:
+        full_path = "index.html"
+    return page_templates.serve(request, full_path)
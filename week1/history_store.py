@@ -0,0 +1,377 @@
+"""
+对话记忆与历史存储
+ChatSystem 的对话记忆（发给模型的消息）和对话历史（/history 返回的记录）都通过
+HistoryStore 读写，默认保存在进程内存中；使用 SQLite（WAL 模式）时多个 worker
+进程共享同一份数据，uvicorn 可以多进程部署而不丢失多轮对话上下文。
+持久存储中的会话不会随某个进程淘汰会话而删除，由 purge_idle 按最后写入时间统一清理。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import itertools
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import BaseChatMessageHistory, BaseMessage
+from langchain.schema.messages import messages_from_dict, messages_to_dict
+
+
+class HistoryStore:
+    """会话记忆与历史的存储接口"""
+
+    # 数据是否在进程外持久保存；非持久存储在会话被淘汰时应同时清理数据
+    persistent = False
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        """获取会话的对话记忆消息"""
+        raise NotImplementedError
+
+    def add_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        """追加对话记忆消息"""
+        raise NotImplementedError
+
+    def replace_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        """用给定消息替换会话的全部记忆消息（摘要记忆裁剪窗口时使用）"""
+        raise NotImplementedError
+
+    def fold_messages(self, session_id: str, folded: Sequence[BaseMessage], summary: str) -> bool:
+        """
+        把最早的若干条记忆消息折叠进摘要（原子操作）
+        只有当前记忆仍以 folded 开头时才删除这些消息并保存新摘要，期间新增的消息保留；
+        记忆已被其他请求折叠或清空时不做修改
+        Returns:
+            bool: 是否完成折叠
+        """
+        raise NotImplementedError
+
+    def get_summary(self, session_id: str) -> str:
+        """获取会话的滚动摘要，没有时返回空字符串"""
+        raise NotImplementedError
+
+    def set_summary(self, session_id: str, summary: str):
+        """保存会话的滚动摘要"""
+        raise NotImplementedError
+
+    def get_turns(self, session_id: str, after: Optional[int] = None,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取会话的对话历史（每轮包含 id/user/assistant/timestamp），按id升序
+        Args:
+            after: 只返回id大于该值的轮次
+            limit: 最多返回的轮数
+        """
+        raise NotImplementedError
+
+    def append_turn(self, session_id: str, turn: Dict[str, str]) -> int:
+        """追加一轮对话历史，返回该轮的id（单调递增，清空后也不会复用）"""
+        raise NotImplementedError
+
+    def turn_stats(self, session_id: str) -> Tuple[int, int]:
+        """返回 (轮数, 最新一轮的id)，用于判断历史是否变化"""
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        """清空会话的记忆和历史"""
+        raise NotImplementedError
+
+    def purge_idle(self, idle_ttl: float) -> int:
+        """删除最后一次写入早于 idle_ttl 秒之前的会话数据，返回删除的会话数"""
+        raise NotImplementedError
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """进程内存存储（默认），仅适用于单 worker 部署"""
+
+    def __init__(self):
+        self._messages: Dict[str, List[BaseMessage]] = defaultdict(list)
+        self._turns: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+        self._summaries: Dict[str, str] = {}
+        self._last_active: Dict[str, float] = {}
+        self._turn_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            return list(self._messages.get(session_id, []))
+
+    def add_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        with self._lock:
+            self._messages[session_id].extend(messages)
+            self._last_active[session_id] = time.time()
+
+    def replace_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        with self._lock:
+            self._messages[session_id] = list(messages)
+            self._last_active[session_id] = time.time()
+
+    def fold_messages(self, session_id: str, folded: Sequence[BaseMessage], summary: str) -> bool:
+        with self._lock:
+            messages = self._messages.get(session_id, [])
+            if messages[:len(folded)] != list(folded):
+                return False
+            self._messages[session_id] = messages[len(folded):]
+            self._summaries[session_id] = summary
+            self._last_active[session_id] = time.time()
+            return True
+
+    def get_summary(self, session_id: str) -> str:
+        with self._lock:
+            return self._summaries.get(session_id, "")
+
+    def set_summary(self, session_id: str, summary: str):
+        with self._lock:
+            self._summaries[session_id] = summary
+            self._last_active[session_id] = time.time()
+
+    def get_turns(self, session_id: str, after: Optional[int] = None,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            turns = self._turns.get(session_id, [])
+            if after is not None:
+                turns = [turn for turn in turns if turn["id"] > after]
+            if limit is not None:
+                turns = turns[:limit]
+            return [dict(turn) for turn in turns]
+
+    def append_turn(self, session_id: str, turn: Dict[str, str]) -> int:
+        with self._lock:
+            turn_id = next(self._turn_ids)
+            self._turns[session_id].append({"id": turn_id, **turn})
+            self._last_active[session_id] = time.time()
+            return turn_id
+
+    def turn_stats(self, session_id: str) -> Tuple[int, int]:
+        with self._lock:
+            turns = self._turns.get(session_id, [])
+            return len(turns), (turns[-1]["id"] if turns else 0)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._clear_locked(session_id)
+
+    def purge_idle(self, idle_ttl: float) -> int:
+        cutoff = time.time() - idle_ttl
+        with self._lock:
+            idle = [session_id for session_id, last_active in self._last_active.items() if last_active < cutoff]
+            for session_id in idle:
+                self._clear_locked(session_id)
+            return len(idle)
+
+    def _clear_locked(self, session_id: str):
+        self._messages.pop(session_id, None)
+        self._turns.pop(session_id, None)
+        self._summaries.pop(session_id, None)
+        self._last_active.pop(session_id, None)
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """SQLite 存储（WAL 模式），多个 worker 进程可同时读写"""
+
+    persistent = True
+
+    def __init__(self, db_path: str):
+        """
+        初始化 SQLite 存储
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        # sqlite3 连接不能跨线程共享，每个线程使用自己的连接
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                user TEXT NOT NULL,
+                assistant TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, id);
+            CREATE TABLE IF NOT EXISTS summaries (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_active REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+        """)
+        # 旧版本数据库中没有会话表，已有的会话从现在开始计算空闲时间
+        now = time.time()
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, last_active) "
+            "SELECT DISTINCT session_id, ? FROM turns UNION SELECT DISTINCT session_id, ? FROM messages",
+            (now, now)
+        )
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下足够安全且写入更快
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, session_id: str):
+        """记录会话的最后写入时间（在写入数据的同一事务中调用）"""
+        conn.execute(
+            "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+            (session_id, time.time())
+        )
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        rows = self._connect().execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id",
+            (session_id,)
+        ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def add_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(session_id, json.dumps(item, ensure_ascii=False))
+                 for item in messages_to_dict(list(messages))]
+            )
+            self._touch(conn, session_id)
+
+    def replace_messages(self, session_id: str, messages: Sequence[BaseMessage]):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(session_id, json.dumps(item, ensure_ascii=False))
+                 for item in messages_to_dict(list(messages))]
+            )
+            self._touch(conn, session_id)
+
+    def fold_messages(self, session_id: str, folded: Sequence[BaseMessage], summary: str) -> bool:
+        conn = self._connect()
+        with conn:
+            # 先取得写锁，比较和删除之间其他进程不能修改记忆
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, message FROM messages WHERE session_id = ? ORDER BY id LIMIT ?",
+                (session_id, len(folded))
+            ).fetchall()
+            if messages_from_dict([json.loads(row[1]) for row in rows]) != list(folded):
+                return False
+            if rows:
+                conn.execute("DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, rows[-1][0]))
+            conn.execute(
+                "INSERT INTO summaries (session_id, summary) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary",
+                (session_id, summary)
+            )
+            self._touch(conn, session_id)
+        return True
+
+    def get_summary(self, session_id: str) -> str:
+        row = self._connect().execute(
+            "SELECT summary FROM summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def set_summary(self, session_id: str, summary: str):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO summaries (session_id, summary) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary",
+                (session_id, summary)
+            )
+            self._touch(conn, session_id)
+
+    def get_turns(self, session_id: str, after: Optional[int] = None,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT id, user, assistant, timestamp FROM turns "
+            "WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (session_id, after or 0, -1 if limit is None else limit)
+        ).fetchall()
+        return [{"id": turn_id, "user": user, "assistant": assistant, "timestamp": timestamp}
+                for turn_id, user, assistant, timestamp in rows]
+
+    def append_turn(self, session_id: str, turn: Dict[str, str]) -> int:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO turns (session_id, user, assistant, timestamp) VALUES (?, ?, ?, ?)",
+                (session_id, turn["user"], turn["assistant"], turn["timestamp"])
+            )
+            self._touch(conn, session_id)
+        return cursor.lastrowid
+
+    def turn_stats(self, session_id: str) -> Tuple[int, int]:
+        count, last_id = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM turns WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        return count, last_id
+
+    def clear(self, session_id: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_idle(self, idle_ttl: float) -> int:
+        conn = self._connect()
+        with conn:
+            idle = "SELECT session_id FROM sessions WHERE last_active < ?"
+            cutoff = (time.time() - idle_ttl,)
+            for table in ("messages", "turns", "summaries"):
+                conn.execute(f"DELETE FROM {table} WHERE session_id IN ({idle})", cutoff)
+            return conn.execute("DELETE FROM sessions WHERE last_active < ?", cutoff).rowcount
+
+
+class StoreChatMessageHistory(BaseChatMessageHistory):
+    """把 HistoryStore 适配为 langchain 的消息历史，供 ConversationBufferMemory 使用"""
+
+    def __init__(self, store: HistoryStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        return self.store.get_messages(self.session_id)
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.store.add_messages(self.session_id, [message])
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+
+
+def create_history_store() -> HistoryStore:
+    """
+    根据环境变量创建存储
+    CHAT_HISTORY_BACKEND: memory（默认）或 sqlite
+    CHAT_HISTORY_DB: SQLite 数据库文件路径，默认 chat_history.db
+    """
+    backend = os.getenv("CHAT_HISTORY_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteHistoryStore(os.getenv("CHAT_HISTORY_DB", "chat_history.db"))
+    if backend == "memory":
+        return InMemoryHistoryStore()
+    raise ValueError(f"不支持的 CHAT_HISTORY_BACKEND: {backend}")
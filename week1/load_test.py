@@ -0,0 +1,62 @@
+"""
+并发压测脚本
+模拟 N 个独立会话同时请求聊天接口，对比总耗时与单请求耗时：
+接口不阻塞事件循环时，总耗时应接近单个请求的最大耗时，而不是所有请求耗时之和。
+使用方法（先启动服务）：
+    uvicorn fast_app:app --host 0.0.0.0 --port 5000
+    python load_test.py --sessions 10 --endpoint /chat
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+
+import httpx
+
+
+async def run_session(base_url: str, endpoint: str, message: str, index: int) -> Tuple[int, float, int]:
+    """
+    以独立会话（独立cookie）发送一次请求
+    Returns:
+        (会话序号, 耗时秒数, HTTP状态码)
+    """
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        start = time.perf_counter()
+        response = await client.post(endpoint, json={"message": f"{message} (#{index})"})
+        if endpoint.endswith("/stream"):
+            # 流式接口需要读完整个事件流才算结束
+            await response.aread()
+        return index, time.perf_counter() - start, response.status_code
+
+
+async def main(base_url: str, endpoint: str, sessions: int, message: str):
+    """并发启动所有会话并汇总耗时"""
+    start = time.perf_counter()
+    results: List[Tuple[int, float, int]] = await asyncio.gather(
+        *(run_session(base_url, endpoint, message, i) for i in range(sessions))
+    )
+    wall = time.perf_counter() - start
+
+    for index, elapsed, status in sorted(results):
+        print(f"会话 {index:3d}: {elapsed:7.2f}s  status={status}")
+
+    latencies = [elapsed for _, elapsed, _ in results]
+    total, longest = sum(latencies), max(latencies)
+    print("-" * 40)
+    print(f"并发会话数:     {sessions}")
+    print(f"总耗时(wall):   {wall:.2f}s")
+    print(f"单请求最大耗时: {longest:.2f}s")
+    print(f"单请求耗时之和: {total:.2f}s")
+    print(f"wall / max = {wall / longest:.2f}  (接近1说明请求在并发执行)")
+    print(f"wall / sum = {wall / total:.2f}  (接近1说明请求被串行化)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="聊天接口并发压测")
+    parser.add_argument("--url", default="http://localhost:5000", help="服务地址")
+    parser.add_argument("--endpoint", default="/chat", help="压测的接口路径")
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--message", default="用一句话介绍你自己", help="发送的消息")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.endpoint, args.sessions, args.message))
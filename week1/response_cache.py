@@ -0,0 +1,171 @@
+"""
+单轮对话响应缓存
+单轮对话没有上下文，相同问题（同一模型、参数和系统提示词）的回答可以直接复用。
+内存中是带过期时间的LRU表，可选再加一层SQLite磁盘缓存（多进程/重启后共享）。
+温度大于0时回答本身带随机性，默认不走缓存，除非显式强制。
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def normalize_input(text: str) -> str:
+    """规范化用户输入：全角转半角、去首尾空白、合并连续空白、英文小写"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class ResponseCache:
+    """内存LRU + 可选SQLite两级响应缓存"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600,
+                 db_path: Optional[str] = None, force: bool = False):
+        """
+        初始化响应缓存
+        Args:
+            max_entries: 内存中最多缓存的条目数
+            ttl: 缓存有效期（秒）
+            db_path: SQLite磁盘缓存路径，为空时只使用内存缓存
+            force: 温度大于0时是否仍然使用缓存
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.force = force
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.db_path = db_path
+        self._local = threading.local()
+        if db_path:
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+
+    def make_key(self, backend: str, model: str, temperature: Optional[float],
+                 system_prompt: str, user_input: str, force: bool = False) -> Optional[str]:
+        """
+        生成缓存键
+        Returns:
+            Optional[str]: 缓存键；温度大于0且未强制使用缓存时返回None（本次请求跳过缓存）
+        """
+        if (temperature or 0) > 0 and not (force or self.force):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        raw = json.dumps([backend, model, temperature, system_prompt, normalize_input(user_input)],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，先查内存再查磁盘，磁盘命中时回填内存"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._entries[key]
+
+        if self.db_path:
+            row = self._connect().execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._put_memory(key, row[0], row[1])
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str):
+        """写入缓存（内存和磁盘）"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_memory(key, response, expires_at)
+            self.stores += 1
+        if self.db_path:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at)
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等统计信息"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk_tier": bool(self.db_path),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "stores": self.stores
+            }
+
+    def _put_memory(self, key: str, response: str, expires_at: float):
+        """写入内存LRU表（调用方需持有锁）"""
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    根据环境变量创建响应缓存，未启用时返回None
+    CHAT_CACHE_ENABLED: 是否启用（默认0）
+    CHAT_CACHE_MAX_ENTRIES / CHAT_CACHE_TTL: 内存条目上限 / 有效期秒数
+    CHAT_CACHE_DB: SQLite磁盘缓存路径，为空则不启用磁盘层
+    CHAT_CACHE_FORCE: 温度大于0时也使用缓存
+    """
+    if os.getenv("CHAT_CACHE_ENABLED", "0") != "1":
+        return None
+    return ResponseCache(
+        max_entries=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000")),
+        ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+        db_path=os.getenv("CHAT_CACHE_DB") or None,
+        force=os.getenv("CHAT_CACHE_FORCE", "0") == "1"
+    )
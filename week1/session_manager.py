@@ -0,0 +1,159 @@
+"""
+会话管理器
+用有界的LRU表保存每个会话的 ChatSystem 实例：
+超过最大会话数时淘汰最久未使用的会话，空闲超过TTL的会话自动过期，
+并统计命中/未命中/淘汰次数和会话内存占用估算。
+内存占用按会话维护累计值，每次请求只更新当前会话，不会遍历所有会话的历史。
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from chatwith_API import ChatSystem
+
+
+class SessionManager:
+    """带LRU淘汰和空闲过期的会话存储"""
+
+    def __init__(self, factory: Callable[[str], "ChatSystem"], max_sessions: int = 1000,
+                 idle_ttl: float = 1800, max_total_bytes: int = 0):
+        """
+        初始化会话管理器
+        Args:
+            factory: 根据会话ID创建 ChatSystem 的函数
+            max_sessions: 最多保留的会话数
+            idle_ttl: 会话空闲多少秒后过期，<=0 表示不过期
+            max_total_bytes: 所有会话估算内存之和的上限，<=0 表示不限制
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_total_bytes = max_total_bytes
+
+        # 会话ID -> (ChatSystem, 最后访问时间)，按访问先后排序，最久未使用的在最前
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+        # 会话ID -> 最近一次记录的内存占用估算，及其总和
+        self._bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_expired = 0
+        self.evicted_memory = 0
+
+    def get(self, session_id: str) -> Optional["ChatSystem"]:
+        """
+        获取已有会话，不存在或已过期时返回None（不会创建新会话）
+        """
+        with self._lock:
+            chat_system = self._lookup(session_id)
+            if chat_system is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return chat_system
+
+    def get_or_create(self, session_id: str) -> "ChatSystem":
+        """
+        获取会话，不存在时创建，并在需要时淘汰旧会话
+        """
+        with self._lock:
+            chat_system = self._lookup(session_id)
+            if chat_system is not None:
+                self.hits += 1
+                return chat_system
+
+            self.misses += 1
+            chat_system = self.factory(session_id)
+            self._sessions[session_id] = (chat_system, time.monotonic())
+            while len(self._sessions) > self.max_sessions:
+                self._evict_oldest()
+                self.evicted_lru += 1
+            return chat_system
+
+    def enforce_memory_limit(self, session_id: str):
+        """
+        会话内容变化后调用：更新该会话的内存占用估算，
+        超过内存上限时从最久未使用的会话开始淘汰（不淘汰当前会话）
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                size = entry[0].estimate_memory_bytes()
+                self._total_bytes += size - self._bytes.get(session_id, 0)
+                self._bytes[session_id] = size
+            if self.max_total_bytes <= 0:
+                return
+            while len(self._sessions) > 1 and self._total_bytes > self.max_total_bytes:
+                if next(iter(self._sessions)) == session_id:
+                    break
+                self._evict_oldest()
+                self.evicted_memory += 1
+
+    def remove(self, session_id: str):
+        """移除指定会话"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._total_bytes -= self._bytes.pop(session_id, 0)
+
+    def total_bytes(self) -> int:
+        """所有会话的内存占用估算之和"""
+        with self._lock:
+            return self._total_bytes
+
+    def metrics(self) -> Dict[str, Any]:
+        """返回会话统计信息（只包含汇总数据，不暴露会话ID）"""
+        with self._lock:
+            self._expire()
+            lookups = self.hits + self.misses
+            oldest_access = next(iter(self._sessions.values()))[1] if self._sessions else None
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evicted": {
+                    "lru": self.evicted_lru,
+                    "expired": self.evicted_expired,
+                    "memory": self.evicted_memory
+                },
+                "total_bytes": self._total_bytes,
+                "max_session_bytes": max(self._bytes.values(), default=0),
+                "max_total_bytes": self.max_total_bytes,
+                "max_idle_seconds": round(time.monotonic() - oldest_access, 1) if oldest_access is not None else 0.0
+            }
+
+    def _lookup(self, session_id: str) -> Optional["ChatSystem"]:
+        """查找会话并刷新其访问时间"""
+        self._expire()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        self._sessions[session_id] = (entry[0], time.monotonic())
+        self._sessions.move_to_end(session_id)
+        return entry[0]
+
+    def _expire(self):
+        """淘汰空闲超时的会话；表按访问时间排序，遇到第一个未过期的即可停止"""
+        if self.idle_ttl <= 0:
+            return
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            _, last_access = next(iter(self._sessions.values()))
+            if last_access >= cutoff:
+                break
+            self._evict_oldest()
+            self.evicted_expired += 1
+
+    def _evict_oldest(self):
+        """淘汰最久未使用的会话，并通知其释放会话数据"""
+        session_id, (chat_system, _) = self._sessions.popitem(last=False)
+        self._total_bytes -= self._bytes.pop(session_id, 0)
+        chat_system.release()
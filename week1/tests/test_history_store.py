@@ -0,0 +1,89 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.schema import AIMessage, HumanMessage
+
+import history_store
+from history_store import InMemoryHistoryStore, SQLiteHistoryStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteHistoryStore(str(tmp_path / "history.db"))
+    return InMemoryHistoryStore()
+
+
+def turn(user, assistant="ok"):
+    return {"user": user, "assistant": assistant, "timestamp": "2024-01-01 00:00:00"}
+
+
+def test_persistent_flag():
+    assert not InMemoryHistoryStore.persistent
+    assert SQLiteHistoryStore.persistent
+
+
+def test_messages_and_summary(store):
+    store.add_messages("s1", [HumanMessage(content="你好"), AIMessage(content="你好！")])
+    store.add_messages("s2", [HumanMessage(content="other")])
+    store.set_summary("s1", "摘要")
+
+    assert [m.content for m in store.get_messages("s1")] == ["你好", "你好！"]
+    assert store.get_summary("s1") == "摘要"
+    assert store.get_summary("s2") == ""
+
+    store.replace_messages("s1", [AIMessage(content="你好！")])
+    assert [m.content for m in store.get_messages("s1")] == ["你好！"]
+
+
+def test_turn_ids_paginate_and_survive_clear(store):
+    ids = [store.append_turn("s1", turn(f"q{i}")) for i in range(3)]
+    assert ids == sorted(ids)
+    assert store.turn_stats("s1") == (3, ids[-1])
+    assert [t["user"] for t in store.get_turns("s1", after=ids[0], limit=1)] == ["q1"]
+
+    store.clear("s1")
+    assert store.turn_stats("s1") == (0, 0)
+    assert store.get_messages("s1") == []
+    # 清空后新的轮次id不会复用，ETag 不会与清空前相同
+    assert store.append_turn("s1", turn("again")) > ids[-1]
+
+
+def test_purge_idle_removes_only_idle_sessions(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(history_store.time, "time", lambda: now[0])
+    store.append_turn("old", turn("q"))
+    store.add_messages("old", [HumanMessage(content="q")])
+    store.set_summary("old", "摘要")
+    now[0] += 100
+    store.append_turn("new", turn("q"))
+
+    assert store.purge_idle(50) == 1
+    assert store.turn_stats("old") == (0, 0)
+    assert store.get_messages("old") == []
+    assert store.get_summary("old") == ""
+    assert store.turn_stats("new")[0] == 1
+
+
+def test_fold_keeps_messages_added_during_summary(store):
+    old = [HumanMessage(content="q1"), AIMessage(content="a1")]
+    store.add_messages("s1", old)
+    folded = store.get_messages("s1")
+    # 摘要生成期间同一会话又完成了一轮
+    store.add_messages("s1", [HumanMessage(content="q2"), AIMessage(content="a2")])
+
+    assert store.fold_messages("s1", folded, "摘要")
+    assert [m.content for m in store.get_messages("s1")] == ["q2", "a2"]
+    assert store.get_summary("s1") == "摘要"
+
+
+def test_fold_is_skipped_when_memory_changed(store):
+    store.add_messages("s1", [HumanMessage(content="q1"), AIMessage(content="a1")])
+    folded = store.get_messages("s1")
+    store.clear("s1")
+    store.add_messages("s1", [HumanMessage(content="new")])
+
+    assert not store.fold_messages("s1", folded, "摘要")
+    assert [m.content for m in store.get_messages("s1")] == ["new"]
+    assert store.get_summary("s1") == ""
@@ -0,0 +1,95 @@
+import pytest
+
+import session_manager
+from session_manager import SessionManager
+
+
+class FakeChatSystem:
+    """只实现 SessionManager 用到的接口"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.size = 0
+        self.released = False
+
+    def estimate_memory_bytes(self):
+        return self.size
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_manager.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_lru_eviction_keeps_recently_used():
+    manager = SessionManager(FakeChatSystem, max_sessions=2, idle_ttl=0)
+    a = manager.get_or_create("a")
+    manager.get_or_create("b")
+    manager.get("a")
+    manager.get_or_create("c")
+
+    assert manager.get("b") is None
+    assert manager.get("a") is a
+    assert manager.metrics()["evicted"]["lru"] == 1
+
+
+def test_idle_sessions_expire(clock):
+    manager = SessionManager(FakeChatSystem, max_sessions=10, idle_ttl=60)
+    old = manager.get_or_create("old")
+    clock[0] += 30
+    manager.get_or_create("new")
+    clock[0] += 40
+
+    assert manager.get("old") is None
+    assert old.released
+    assert manager.get("new") is not None
+    assert manager.metrics()["evicted"]["expired"] == 1
+
+
+def test_memory_limit_evicts_oldest_but_not_current():
+    manager = SessionManager(FakeChatSystem, max_sessions=10, idle_ttl=0, max_total_bytes=100)
+    a = manager.get_or_create("a")
+    a.size = 60
+    manager.enforce_memory_limit("a")
+    b = manager.get_or_create("b")
+    b.size = 60
+    manager.enforce_memory_limit("b")
+
+    assert a.released
+    assert manager.total_bytes() == 60
+
+    # 当前会话自身超限时不会被淘汰
+    b.size = 500
+    manager.enforce_memory_limit("b")
+    assert manager.get("b") is b
+    assert manager.total_bytes() == 500
+
+
+def test_running_total_follows_eviction_and_remove():
+    manager = SessionManager(FakeChatSystem, max_sessions=1, idle_ttl=0)
+    a = manager.get_or_create("a")
+    a.size = 10
+    manager.enforce_memory_limit("a")
+    manager.get_or_create("b").size = 5
+    manager.enforce_memory_limit("b")
+    assert manager.total_bytes() == 5
+
+    manager.remove("b")
+    assert manager.total_bytes() == 0
+
+
+def test_metrics_do_not_expose_session_ids():
+    manager = SessionManager(FakeChatSystem, max_sessions=10, idle_ttl=0)
+    manager.get_or_create("secret-session-id").size = 42
+    manager.enforce_memory_limit("secret-session-id")
+
+    metrics = manager.metrics()
+    assert "secret-session-id" not in repr(metrics)
+    assert metrics["active_sessions"] == 1
+    assert metrics["total_bytes"] == 42
+    assert metrics["max_session_bytes"] == 42
@@ -0,0 +1,116 @@
+"""
+窗口 + 滚动摘要对话记忆
+只把最近 K 轮对话原文发给模型，并受 token 预算约束；滑出窗口的旧对话
+增量合并进一段滚动摘要（每次只总结新滑出的几轮，不重新总结全部历史），
+使多轮对话的提示词长度不再随对话轮数线性增长。
+摘要在回复返回之后于后台生成（见 ChatSystem），提交时只删除参与摘要的旧消息，
+摘要期间同一会话新增的消息不会丢失。
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.prompts import PromptTemplate
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
+
+# 增量摘要模板：在已有摘要基础上加入新滑出窗口的对话
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""请逐步总结对话内容，在已有摘要的基础上加入新的对话，返回新的摘要。
+摘要需保留用户的关键信息、偏好和尚未解决的问题，尽量简短。
+
+已有摘要:
+{summary}
+
+新的对话:
+{new_lines}
+
+新的摘要:"""
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数，不依赖分词器
+    中日韩字符按每字1个token计，其余字符按每4个字符1个token计
+    """
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af"
+              or "\uf900" <= ch <= "\ufaff" or "\uff00" <= ch <= "\uffef")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _message_text(message: Any) -> str:
+    """统一LLM（返回str）与ChatModel（返回消息）的输出"""
+    if isinstance(message, str):
+        return message
+    return str(message.content)
+
+
+class SummaryWindowMemory(BaseChatMemory):
+    """保留最近若干轮原文、其余折叠为滚动摘要的对话记忆"""
+
+    llm: Any
+    """用于生成摘要的模型"""
+    window_turns: int = 6
+    """原文保留的最大轮数"""
+    token_budget: int = 2000
+    """摘要与窗口原文合计的token预算"""
+    memory_key: str = "history"
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def summary(self) -> str:
+        """当前的滚动摘要（保存在消息历史的存储中）"""
+        return self.chat_memory.store.get_summary(self.chat_memory.session_id)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """返回摘要 + 窗口内的原文消息"""
+        messages: List[BaseMessage] = []
+        summary = self.summary
+        if summary:
+            messages.append(SystemMessage(content=f"之前对话的摘要: {summary}"))
+        messages.extend(self.chat_memory.messages)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def plan_prune(self) -> Optional[Tuple[List[BaseMessage], str]]:
+        """
+        计算需要折叠的旧消息
+        Returns:
+            Optional[tuple]: (需要折叠的旧消息, 摘要提示词)，不需要折叠时返回None
+        """
+        overflow, _ = self._split_overflow()
+        if not overflow:
+            return None
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "无",
+                                       new_lines=get_buffer_string(overflow))
+        return overflow, prompt
+
+    def commit_prune(self, overflow: List[BaseMessage], summary: str) -> bool:
+        """保存新的摘要并删除已折叠的旧消息，记忆已被其他请求修改时放弃本次摘要"""
+        return self.chat_memory.store.fold_messages(self.chat_memory.session_id, overflow, summary.strip())
+
+    def prune(self) -> bool:
+        """把超出窗口或预算的旧对话折叠进摘要（同步），返回是否完成折叠"""
+        plan = self.plan_prune()
+        if plan is None:
+            return False
+        overflow, prompt = plan
+        return self.commit_prune(overflow, _message_text(self.llm.invoke(prompt)))
+
+    def _split_overflow(self):
+        """
+        把记忆消息分为需要折叠的旧消息和保留的窗口消息
+        先按轮数截取，再在token预算内从最旧的一轮开始继续丢弃（至少保留最近一轮）
+        """
+        messages = self.chat_memory.messages
+        keep = messages[-self.window_turns * 2:] if self.window_turns > 0 else []
+        budget = self.token_budget - estimate_tokens(self.summary)
+        while len(keep) > 2 and estimate_tokens(get_buffer_string(keep)) > budget:
+            keep = keep[2:]
+        return messages[:len(messages) - len(keep)], keep
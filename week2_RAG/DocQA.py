@@ -35,10 +35,6 @@ for file in os.listdir(base_dir):
 print(f"Loaded {len(documents)} documents from {base_dir}")
 print("Documents:", documents)
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-# 初始化文本分割器，设置分割块大小和重叠
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
 
 # 定义嵌入模型路径
 m3e_name = r"E:\0projects\summer_school\embedding_models\moka\m3e-base"
@@ -65,6 +61,14 @@ embedding_model = HuggingFaceEmbeddings(
     encode_kwargs=encode_kwargs  # 编码参数
 )
 
+# 加上向量缓存（与 RAGC.py 共用），内容没变的分块不再重新嵌入
+from embedding_cache import with_cache
+embedding_model = with_cache(embedding_model, m3e_name, encode_kwargs["normalize_embeddings"])
+
+# 初始化文本分割器，分块策略、大小和重叠与 RAGC.py 共用同一组环境变量（默认按字符 200/50）
+from chunking import create_splitter
+text_splitter = create_splitter(model_path=m3e_name)
+
 #pip install qdrant-client
 
 from langchain_community.vectorstores import Qdrant
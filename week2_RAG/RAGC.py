@@ -1,77 +1,285 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import json
+import time
+import uuid
+import threading
+from contextlib import nullcontext
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
-from langchain.schema import Document
-from langchain_openai import ChatOpenAI
 from langchain_deepseek import ChatDeepSeek
-from langchain.chains import RetrievalQA
-from langchain.retrievers import MultiQueryRetriever
+from langchain.chains.question_answering import load_qa_chain
+from langchain_core.prompts import format_document
 from pydantic import SecretStr
 
+from vector_index import (PersistentIndex, scan_files, diff_files, memory_vectorstore,
+                          upsert_chunks, iter_documents, get_documents)
+from chunk_records import make_chunks
+from chunking import create_splitter, CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP
+from lexical_index import BM25Index
+from retrievers import (HybridRetriever, VectorRetriever, ConcurrentMultiQueryRetriever,
+                        RETRIEVAL_MODES, RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_FETCH_K)
+from document_loader import StreamingLoader, list_files
+from embedding_pipeline import (BatchedEmbeddings, configure_torch_threads,
+                                EMBED_BATCH_SIZE, INGEST_BATCH_SIZE)
+from embedding_cache import with_cache
+from reranker import create_reranker, RERANK_CANDIDATES
+from semantic_cache import create_semantic_cache
+
 
 
 class RAGChain:
-    def __init__(self, base_dir, embedding_model_path, api_key):
+    def __init__(self, base_dir, embedding_model_path, api_key, index_dir=None,
+                 collection_name="my_documents"):
         self.base_dir = base_dir
         self.embedding_model_path = embedding_model_path
         self.api_key = api_key
-        self.documents = []
+        # 分块策略和参数由环境变量 RAG_CHUNK_STRATEGY / RAG_CHUNK_SIZE / RAG_CHUNK_OVERLAP 配置
+        self.chunk_strategy = CHUNK_STRATEGY
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_overlap = CHUNK_OVERLAP
+        self.normalize_embeddings = True
+        self.embed_batch_size = EMBED_BATCH_SIZE
+        # 指定 index_dir 时向量索引持久化到磁盘，否则使用内存模式
+        self.index = PersistentIndex(index_dir, collection_name) if index_dir else None
+        self.collection_name = collection_name
+        # 无法读取的文件 {文件名: 错误}，连同文件哈希记入 manifest，文件内容变化后才会重试
+        self.load_failures = {}
         self.vectorstore = None
         self.chat_model = None
         self.qa_chain = None
-        
+        self.embedding_model = None
+        if RETRIEVAL_MODE not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {RETRIEVAL_MODE}，可选: {', '.join(RETRIEVAL_MODES)}")
+        self.retrieval_mode = RETRIEVAL_MODE
+        self.retrieval_k = RETRIEVAL_K
+        self.retrieval_fetch_k = RETRIEVAL_FETCH_K
+        # 可选的交叉编码器重排序，由 RAG_RERANKER_MODEL 启用
+        self.reranker = None
+        self.rerank_candidates = RERANK_CANDIDATES
+        # 可选的语义答案缓存，由 RAG_SEMANTIC_CACHE 启用；索引内容每次变化都会更换 index_version，使缓存失效
+        self.answer_cache = create_semantic_cache()
+        self.index_version = None
+        # 混合检索用的 BM25 索引，启动或全量重建时从向量库构建，增量同步时只更新变化的文件
+        self.lexical_index = BM25Index()
+        # 增量同步与后台监视线程互斥
+        self._sync_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watch = threading.Event()
 
-    def load_documents(self):
-        if not os.path.exists(self.base_dir):
-            print(f"目录 '{self.base_dir}' 不存在，正在创建...")
-            os.makedirs(self.base_dir)
+    def ingest_files(self, files, vectorstore=None):
+        """
+        流式加载文件并写入向量存储：文件在进程池中解析，解析完一个就分块，
+        攒够一批再嵌入写入，不会把整个语料同时放在内存里
+        Args:
+            files: 文档目录下的文件名
+            vectorstore: 写入的向量存储，默认为当前向量存储
+        Returns:
+            tuple: (写入的分块数, 无法读取的文件 {文件名: 错误})
+        """
+        vectorstore = vectorstore or self.vectorstore
+        loader = StreamingLoader(self.base_dir)
+        splitter = self.text_splitter()
+        buffer, total, duplicates = [], 0, 0
+        for file, documents in loader.iter_files(files):
+            buffer.extend(make_chunks(documents, splitter))
+            if len(buffer) >= INGEST_BATCH_SIZE:
+                duplicates += upsert_chunks(vectorstore, buffer)
+                total += len(buffer)
+                buffer = []
+        if buffer:
+            duplicates += upsert_chunks(vectorstore, buffer)
+            total += len(buffer)
+
+        if duplicates:
+            print(f"合并了 {duplicates} 个内容重复的分块")
+        self.report_embedding_stats(self.embedding_model)
+        return total, loader.failures
+
+    def refresh_lexical_index(self):
+        """混合检索模式下用向量库中的全部分块重建 BM25 索引"""
+        if self.retrieval_mode != "hybrid" or self.vectorstore is None:
+            return
+        self.lexical_index.build(iter_documents(self.vectorstore))
+        print(f"BM25 index rebuilt with {len(self.lexical_index)} chunks")
+
+    def update_lexical_index(self, sources):
+        """混合检索模式下只替换 sources 中各文件的 BM25 分块，不遍历整个向量库"""
+        if self.retrieval_mode != "hybrid" or self.vectorstore is None or not sources:
+            return
+        # 原来属于这些文件的共享分块可能还在，只是来源变了，按ID重新读取
+        previous = self.lexical_index.chunk_ids(sources)
+        documents = list(iter_documents(self.vectorstore, sources)) + get_documents(self.vectorstore, previous)
+        self.lexical_index.replace_sources(sources, documents)
 
-        for file in os.listdir(self.base_dir):
-            file_path = os.path.join(self.base_dir, file)
-            if file.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-                self.documents.extend(loader.load())
-            elif file.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-                self.documents.extend(loader.load())
-            elif file.endswith(".txt"):
-                with open(file_path, encoding="utf-8") as f:
-                    text = f.read()
-                self.documents.append({"content": text, "file_path": file_path})
-
-        print(f"Loaded {len(self.documents)} documents from {self.base_dir}")
+    def text_splitter(self):
+        return create_splitter(self.chunk_strategy, self.chunk_size, self.chunk_overlap,
+                               self.embedding_model_path)
 
     def initialize_embedding_model(self):
         if not os.path.exists(self.embedding_model_path):
             raise FileNotFoundError(f"模型路径 {self.embedding_model_path} 不存在，请检查路径或下载模型")
 
+        threads = configure_torch_threads()
         model_kwargs = {"device": "cpu"}
-        encode_kwargs = {"normalize_embeddings": True}
+        encode_kwargs = {"normalize_embeddings": self.normalize_embeddings,
+                         "batch_size": self.embed_batch_size}
 
         embedding_model = HuggingFaceEmbeddings(
             model_name=self.embedding_model_path,
             model_kwargs=model_kwargs,
             encode_kwargs=encode_kwargs
         )
+        print(f"Embedding model on cpu, torch threads: {threads}, batch size: {self.embed_batch_size}")
+
+        # 缓存在批量嵌入外层：只有未命中的分块才排序、分批送入模型
+        return with_cache(BatchedEmbeddings(embedding_model, batch_size=self.embed_batch_size),
+                          self.embedding_model_path, self.normalize_embeddings)
+
+    def report_embedding_stats(self, embedding_model):
+        stats = getattr(embedding_model, "stats", None)
+        if stats is not None:
+            print(f"Embedding stats: {stats()}")
+            embedding_model.reset_stats()
+
+    def index_settings(self):
+        # 这些参数任一变化都会使已有索引失效
+        return {
+            "embedding_model": self.embedding_model_path,
+            "normalize_embeddings": self.normalize_embeddings,
+            "chunk_strategy": self.chunk_strategy,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            # 分块元数据格式（见 chunk_records.py），格式变化时需要重建
+            "chunk_format": 2,
+        }
+
+    def load_or_create_vectorstore(self, embedding_model):
+        """
+        优先加载磁盘上的索引并增量同步文档目录的变化；
+        索引缺失或嵌入模型、分块参数变化时整体重建
+        """
+        self.embedding_model = embedding_model
+        if self.index is None:
+            self.create_vectorstore(embedding_model)
+            return
+
+        reason = self.index.mismatch_reason(self.index_settings())
+        if reason is None:
+            self.vectorstore = self.index.open(embedding_model)
+            print(f"Loaded persistent index from {self.index.index_dir}")
+            # 启动时从向量库完整建立一次 BM25 索引，之后的同步只更新变化的文件
+            self.refresh_lexical_index()
+            self.bump_index_version()
+            self.sync_documents()
+            return
+
+        print(f"重建索引: {reason}")
+        self.rebuild_index()
 
-        return embedding_model
+    def rebuild_index(self):
+        """全量重建索引（写入新的向量存储后再替换，重建期间问答继续使用当前索引），未启用持久化时重建内存索引"""
+        with self._sync_lock:
+            self.create_vectorstore(self.embedding_model)
+
+    def sync_documents(self):
+        """
+        增量同步文档目录：只嵌入新增或内容变化的文件，删除已移除文件的向量
+        文件的修改时间和大小都没变时不重新计算哈希；读取失败的文件在内容变化前不再重试
+        Returns:
+            dict: 新增、修改、删除的文件列表，新写入和删除的分块数，本次读取失败的文件
+        """
+        if self.index is None:
+            raise ValueError("未启用持久化索引，无法增量同步")
+
+        with self._sync_lock:
+            manifest = self.index.load_manifest() or {}
+            previous = manifest.get("files", {})
+            current = scan_files(self.base_dir, previous)
+            added, changed, removed = diff_files(previous, current)
+
+            deleted = 0
+            for file in changed + removed:
+                deleted += self.index.delete_source(file)
+            chunks, failures = self.ingest_files(added + changed)
+
+            # 读取失败的文件连同哈希记入 manifest，内容不变时不会在每次同步中重试
+            current = {file: {**info, "failed": failures[file]} if file in failures else info
+                       for file, info in current.items()}
+            # 只有修改时间变化的文件也要更新 manifest，下次就不必再计算哈希
+            if current != previous:
+                self.index.save_manifest(self.index_settings(), current)
+            self.load_failures = {file: info["failed"] for file, info in current.items() if "failed" in info}
+            # 没有分块写入或删除时（例如只有读取失败的文件）索引内容不变，BM25 和答案缓存都不需要更新
+            if chunks or deleted:
+                self.update_lexical_index(added + changed + removed)
+                self.bump_index_version()
+
+        result = {"added": added, "changed": changed, "removed": removed,
+                  "chunks": chunks, "deleted": deleted, "failed": failures}
+        if added or changed or removed:
+            print(f"增量同步索引: {result}")
+        return result
+
+    def start_watcher(self, interval):
+        """启动后台线程，每隔 interval 秒检查一次文档目录并增量同步"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop_watch.wait(interval):
+                try:
+                    self.sync_documents()
+                except Exception as e:
+                    print(f"增量同步失败: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="rag-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_watch.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
 
     def create_vectorstore(self, embedding_model):
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
-        documents = [
-            Document(page_content=doc["content"], metadata={"file_path": doc["file_path"]})
-            for doc in self.documents
-        ]
-        chunked_documents = text_splitter.split_documents(documents)
-
-        self.vectorstore = Qdrant.from_documents(
-            documents=chunked_documents,
-            embedding=embedding_model,
-            location=":memory:",
-            collection_name="my_documents"
-        )
+        """
+        新建向量存储并流式写入文档目录中的全部文件，全部写完后才替换当前向量存储；
+        启用持久化时写入新集合，替换后更新 manifest 并删除旧集合。返回无法读取的文件
+        """
+        if not os.path.exists(self.base_dir):
+            print(f"目录 '{self.base_dir}' 不存在，正在创建...")
+            os.makedirs(self.base_dir)
+
+        self.embedding_model = embedding_model
+        files = scan_files(self.base_dir) if self.index is not None else {}
+        if self.index is not None:
+            collection_name, vectorstore = self.index.create_staging(embedding_model)
+        else:
+            vectorstore = memory_vectorstore(self.collection_name, embedding_model)
+
+        paths = list_files(self.base_dir)
+        chunks, failures = self.ingest_files(paths, vectorstore)
+        print(f"Indexed {chunks} chunks from {len(paths) - len(failures)} files in {self.base_dir}")
+
+        self.vectorstore = vectorstore
+        self.load_failures = dict(failures)
+        if self.index is not None:
+            # 读取失败的文件连同哈希记入 manifest，内容变化后同步时才会重试
+            files = {file: {**info, "failed": failures[file]} if file in failures else info
+                     for file, info in files.items()}
+            self.index.activate(collection_name, self.index_settings(), files)
+        self.refresh_lexical_index()
+        self.bump_index_version()
+        return failures
+
+    def bump_index_version(self):
+        self.index_version = uuid.uuid4().hex
+
+    def initialize_reranker(self):
+        """配置了重排序模型时加载它"""
+        self.reranker = create_reranker()
+        if self.reranker is not None:
+            self.reranker.load()
+            print(f"Reranker loaded from {self.reranker.model_path}")
 
     def initialize_chat_model(self):
         if not self.api_key:
@@ -83,21 +291,184 @@ class RAGChain:
         )
 
     def create_qa_chain(self):
-        if not self.vectorstore:
-            raise ValueError("Vectorstore 未初始化，请先调用 create_vectorstore 方法。")
+        """构建生成回答用的 stuff 文档链；检索由 retrieve 完成，链上不挂检索器"""
         if not self.chat_model:
             raise ValueError("Chat model 未初始化，请先调用 initialize_chat_model 方法。")
+        self.qa_chain = load_qa_chain(self.chat_model, chain_type="stuff")
 
-        retriever_from_llm = MultiQueryRetriever.from_llm(
-            retriever=self.vectorstore.as_retriever(),
-            llm=self.chat_model
-        )
-
-        self.qa_chain = RetrievalQA.from_chain_type(self.chat_model, retriever=retriever_from_llm)
+    def build_retriever(self, sources=None, timings=None, generation_slot=None, vector=None):
+        """
+        按检索模式构建检索器，启用重排序时检索 rerank_candidates 个候选
+        Args:
+            sources: 只检索这些文件中的分块
+            timings: 记录各阶段耗时的字典
+            generation_slot: 改写查询的大模型调用前需要获取的信号量
+            vector: 预先算好的问题向量
+        """
+        k = max(self.retrieval_k, self.rerank_candidates) if self.reranker else self.retrieval_k
+        common = {"vectorstore": self.vectorstore, "k": k,
+                  "sources": sources, "timings": timings, "query_vector": vector}
+        if self.retrieval_mode == "hybrid":
+            return HybridRetriever(lexical_index=self.lexical_index, fetch_k=self.retrieval_fetch_k, **common)
+        if self.retrieval_mode == "multi_query":
+            return ConcurrentMultiQueryRetriever(llm=self.chat_model, llm_slot=generation_slot, **common)
+        return VectorRetriever(**common)
 
-    def ask_question(self, question):
+    def retrieve(self, question, sources=None, timings=None, generation_slot=None, vector=None):
+        """
+        检索（以及可选的重排序）送入提示词的分块
+        Returns:
+            tuple: (分块列表, 是否完成重排序；未启用重排序时为 None)
+        """
         if not self.qa_chain:
             raise ValueError("QA Chain 未初始化")
+        timings = timings if timings is not None else {}
+
+        start = time.perf_counter()
+        docs = self.build_retriever(sources, timings, generation_slot, vector).invoke(question)
+        timings["retrieval"] = time.perf_counter() - start
+
+        reranked = None
+        if self.reranker is not None:
+            rerank_start = time.perf_counter()
+            docs, reranked = self.reranker.rerank(question, docs, self.retrieval_k)
+            timings["rerank"] = time.perf_counter() - rerank_start
+        return docs, reranked
+
+    def ask_question(self, question, sources=None, generation_slot=None, vector=None):
+        """
+        检索并生成回答
+        Args:
+            question: 问题
+            sources: 只检索这些文件中的分块
+            generation_slot: 每次大模型调用（改写查询、生成回答）前需要获取的信号量，用于限制并发数
+            vector: 预先算好的问题向量（批量问答一次嵌入全部问题），为空时在检索时计算
+        Returns:
+            dict: query、result、检索到的 sources，以及各阶段耗时 timings（毫秒）
+        """
+        start = time.perf_counter()
+        timings = {}
+        cached, cache_key = self.lookup_answer(question, sources, timings, vector)
+        if cached is not None:
+            timings["total"] = time.perf_counter() - start
+            return {**cached, "timings": format_timings(timings)}
+
+        if cache_key is not None:
+            vector = cache_key[1]
+        docs, reranked = self.retrieve(question, sources, timings, generation_slot, vector)
 
-        result = self.qa_chain.invoke({"query": question})
+        generation_start = time.perf_counter()
+        with generation_slot or nullcontext():
+            timings["generation_wait"] = time.perf_counter() - generation_start
+            answer = self.qa_chain.run(input_documents=docs, question=question)
+        timings["generation"] = time.perf_counter() - generation_start - timings["generation_wait"]
+        timings["total"] = time.perf_counter() - start
+
+        result = {
+            "query": question,
+            "result": answer,
+            "sources": describe_sources(docs),
+            "timings": format_timings(timings),
+        }
+        if reranked is not None:
+            # False 表示超出时间预算，使用了检索原顺序
+            result["reranked"] = reranked
+        self.store_answer(cache_key, result)
         return result
+
+    def lookup_answer(self, question, sources=None, timings=None, vector=None):
+        """
+        在语义缓存中查找相似问题的回答
+        Returns:
+            tuple: (命中时的结果，否则 None, 写回缓存用的键；未启用缓存时为 None)
+        """
+        if self.answer_cache is None:
+            return None, None
+        start = time.perf_counter()
+        # 未命中时写回缓存用的键里带着问题向量，检索阶段直接使用，不会重复计算
+        if vector is None:
+            vector = self.embedding_model.embed_query(question)
+        scope = json.dumps(sorted(sources or []), ensure_ascii=False)
+        version = self.index_version
+        hit = self.answer_cache.lookup(vector, scope, version)
+        if timings is not None:
+            timings["cache_lookup"] = time.perf_counter() - start
+        if hit is None:
+            return None, (question, vector, scope, version)
+        cached = hit["result"]
+        cached.pop("timings", None)
+        cached.update({"query": question, "cached": True,
+                       "cached_question": hit["question"], "similarity": hit["similarity"]})
+        return cached, None
+
+    def store_answer(self, cache_key, result):
+        if cache_key is None:
+            return
+        question, vector, scope, version = cache_key
+        self.answer_cache.store(question, vector, scope, version,
+                                {k: v for k, v in result.items() if k != "timings"})
+
+    def stream_answer(self, question, sources=None):
+        """
+        流式问答：检索完成后先产出 ("sources", 来源列表)，再逐个产出 ("token", 文本)，
+        最后产出 ("done", {"timings": ...})
+        """
+        start = time.perf_counter()
+        timings = {}
+        cached, cache_key = self.lookup_answer(question, sources, timings)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["result"]
+            timings["total"] = time.perf_counter() - start
+            yield "done", {"timings": format_timings(timings), "cached": True,
+                           "cached_question": cached["cached_question"], "similarity": cached["similarity"]}
+            return
+
+        vector = cache_key[1] if cache_key is not None else None
+        docs, reranked = self.retrieve(question, sources, timings, vector=vector)
+        yield "sources", describe_sources(docs)
+
+        generation_start = time.perf_counter()
+        tokens = []
+        for chunk in self.chat_model.stream(self.answer_prompt(question, docs)):
+            if chunk.content:
+                if "first_token" not in timings:
+                    timings["first_token"] = time.perf_counter() - start
+                tokens.append(chunk.content)
+                yield "token", chunk.content
+        timings["generation"] = time.perf_counter() - generation_start
+        timings["total"] = time.perf_counter() - start
+
+        done = {"timings": format_timings(timings)}
+        if reranked is not None:
+            done["reranked"] = reranked
+        # 只缓存完整生成的回答（客户端中途断开时不会执行到这里）
+        self.store_answer(cache_key, {"query": question, "result": "".join(tokens),
+                                      "sources": describe_sources(docs), **done})
+        yield "done", done
+
+    def answer_prompt(self, question, docs):
+        """按问答链的提示词模板拼出生成回答用的消息（与 stuff 文档链的拼接方式一致）"""
+        chain = self.qa_chain
+        context = chain.document_separator.join(format_document(doc, chain.document_prompt) for doc in docs)
+        return chain.llm_chain.prompt.format_prompt(
+            **{chain.document_variable_name: context, "question": question}
+        ).to_messages()
+
+
+def format_timings(timings):
+    """秒 -> 毫秒"""
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+
+
+def describe_sources(docs):
+    """返回给前端的分块来源：文件、页码、得分"""
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "score": doc.metadata.get("rerank_score", doc.metadata.get("score")),
+            "chunk_id": doc.metadata.get("chunk_id"),
+        }
+        for doc in docs
+    ]
@@ -0,0 +1,75 @@
+"""
+批量问答命令行工具
+读取 JSONL 问题文件（格式见 batch_qa.py），按完成顺序把结果逐行写入 JSONL，
+结束时在标准错误输出汇总（成功/失败数、总耗时、平均每题耗时）。
+注意：持久化索引目录同一时刻只能被一个进程打开，运行前先停止 fastapi_app，
+或者直接调用服务的 /ask/batch 接口。
+使用方法：
+    python ask_batch.py questions.jsonl -o answers.jsonl
+    python ask_batch.py questions.jsonl --workers 16 --llm-concurrency 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+from RAGC import RAGChain
+from batch_qa import parse_questions, run_batch, BATCH_WORKERS, BATCH_LLM_CONCURRENCY
+
+DEFAULT_MODEL = r"E:\0projects\summer_school\embedding_models\moka\m3e-base"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG 批量问答")
+    parser.add_argument("input", help="问题文件（JSONL），- 表示标准输入")
+    parser.add_argument("-o", "--output", default="-", help="结果文件（JSONL），默认输出到标准输出")
+    parser.add_argument("--docs", default=os.path.join(os.path.dirname(__file__), "documents"),
+                        help="文档目录")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="嵌入模型路径")
+    parser.add_argument("--index-dir", default=None,
+                        help="向量索引目录，默认取 RAG_INDEX_DIR 或 week2_RAG/index")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="并行处理的问题数")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY,
+                        help="同时进行的大模型调用数（改写查询、生成回答）")
+    args = parser.parse_args()
+
+    load_dotenv()
+    index_dir = args.index_dir or os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "index"))
+
+    if args.input == "-":
+        items = parse_questions(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            items = parse_questions(f)
+
+    rag_chain = RAGChain(args.docs, args.model, os.getenv("DEEPSEEK_API_KEY"), index_dir=index_dir)
+    rag_chain.load_or_create_vectorstore(rag_chain.initialize_embedding_model())
+    rag_chain.initialize_reranker()
+    rag_chain.initialize_chat_model()
+    rag_chain.create_qa_chain()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    succeeded = failed = 0
+    try:
+        for result in run_batch(rag_chain, items, args.workers, args.llm_concurrency):
+            if result.get("type") == "batch":
+                print(f"{result['questions']} 个问题，批量嵌入耗时 {result['embed_ms']} ms", file=sys.stderr)
+                continue
+            if "error" in result:
+                failed += 1
+            else:
+                succeeded += 1
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"完成: 成功 {succeeded}，失败 {failed}，总耗时 {elapsed:.1f} s，"
+          f"平均 {elapsed / max(1, len(items)):.2f} s/题", file=sys.stderr)
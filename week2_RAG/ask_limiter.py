@@ -0,0 +1,189 @@
+"""
+/ask 并发控制
+问答包含嵌入、向量检索和多次大模型调用，全部是阻塞操作。请求在专用的有界线程池中执行，
+同时执行的请求数不超过 max_in_flight，其余请求排队等待；排队人数超过上限或等待超时时
+直接拒绝（429），避免请求无限堆积使所有用户的延迟一起失控。
+批量问答按内部的并行数占用多个名额，不会绕过同时执行数的上限。
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+# 同时执行的问答请求数
+ASK_MAX_IN_FLIGHT = int(os.getenv("RAG_ASK_MAX_IN_FLIGHT", "4"))
+# 最多排队的请求数
+ASK_MAX_QUEUE = int(os.getenv("RAG_ASK_MAX_QUEUE", "32"))
+# 排队等待的最长秒数
+ASK_QUEUE_TIMEOUT = float(os.getenv("RAG_ASK_QUEUE_TIMEOUT", "30"))
+
+
+class Overloaded(Exception):
+    """排队已满或等待超时"""
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AskLimiter:
+    """有界线程池 + 排队上限 + 排队超时，并统计队列深度和延迟"""
+
+    def __init__(self, max_in_flight: int = ASK_MAX_IN_FLIGHT, max_queue: int = ASK_MAX_QUEUE,
+                 queue_timeout: float = ASK_QUEUE_TIMEOUT, window: int = 1000):
+        """
+        初始化并发控制
+        Args:
+            max_in_flight: 同时执行的请求数（也是线程池大小）
+            max_queue: 最多排队的请求数
+            queue_timeout: 排队等待的最长秒数
+            window: 计算延迟分位数时保留的最近请求数
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="rag-ask")
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.max_queued_seen = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self._waits = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+
+    @asynccontextmanager
+    async def slot(self, count: int = 1):
+        """
+        获取执行名额，排队已满或超时时抛出 Overloaded
+        count > 1 时（批量问答）先排队获取一个名额，再占用当时空闲的名额，最多 count 个，
+        不会持有部分名额等待其他请求释放；产出实际获得的名额数
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        start = time.perf_counter()
+        if self._semaphore.locked():
+            await self._wait_in_queue()
+        else:
+            # 有空闲名额时不经过队列，acquire 不会阻塞
+            await self._semaphore.acquire()
+        granted = 1
+        while granted < count and not self._semaphore.locked():
+            await self._semaphore.acquire()
+            granted += 1
+
+        with self._lock:
+            self.in_flight += granted
+            self._waits.append(time.perf_counter() - start)
+        run_start = time.perf_counter()
+        ok = False
+        try:
+            yield granted
+            ok = True
+        finally:
+            for _ in range(granted):
+                self._semaphore.release()
+            with self._lock:
+                self.in_flight -= granted
+                self._latencies.append(time.perf_counter() - run_start)
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    async def _wait_in_queue(self):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected_full += 1
+                raise Overloaded("排队人数已满")
+            self.queued += 1
+            self.max_queued_seen = max(self.max_queued_seen, self.queued)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.rejected_timeout += 1
+            raise Overloaded("排队等待超时")
+        finally:
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, func, *args):
+        """在排队后于专用线程池中执行阻塞函数"""
+        async with self.slot():
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def stream(self, func, *args, slots: int = 1):
+        """
+        在排队后于专用线程池中运行同步生成器，逐项异步产出
+        slots > 1 时按 slot(slots) 占用多个名额，实际获得的名额数以 workers 关键字参数传给 func，
+        func 内部的并行度不超过它占用的名额，总的同时执行数仍受 max_in_flight 限制
+        调用方提前停止迭代（例如客户端断开）时，生成器在下一项处停止
+        """
+        async with self.slot(slots) as granted:
+            kwargs = {"workers": granted} if slots > 1 else {}
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            stopped = threading.Event()
+            finished = object()
+
+            def produce():
+                items = func(*args, **kwargs)
+                try:
+                    for item in items:
+                        if stopped.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+                finally:
+                    # 在名额释放前关闭生成器，它的清理（例如等待批次中正在执行的问题）仍计入名额
+                    close = getattr(items, "close", None)
+                    if close is not None:
+                        close()
+                    loop.call_soon_threadsafe(queue.put_nowait, (finished, None))
+
+            future = loop.run_in_executor(self.executor, produce)
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if error is not None:
+                        raise error
+                    if item is finished:
+                        break
+                    yield item
+            finally:
+                stopped.set()
+                await future
+
+    def metrics(self):
+        with self._lock:
+            waits, latencies = list(self._waits), list(self._latencies)
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_queued_seen": self.max_queued_seen,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "queue_wait_ms": {"p50": round(_percentile(waits, 0.5) * 1000, 1),
+                                  "p95": round(_percentile(waits, 0.95) * 1000, 1)},
+                "latency_ms": {"p50": round(_percentile(latencies, 0.5) * 1000, 1),
+                               "p95": round(_percentile(latencies, 0.95) * 1000, 1),
+                               "p99": round(_percentile(latencies, 0.99) * 1000, 1)},
+            }
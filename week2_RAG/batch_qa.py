@@ -0,0 +1,83 @@
+"""
+批量问答
+输入为 JSONL，每行一个问题：{"id": "q1", "question": "理想是什么", "sources": ["理想.txt"]}
+（id、sources 可省略，也可以每行直接是一个 JSON 字符串）。
+所有问题的向量先分批一次性计算，再随问题传给检索（不依赖嵌入缓存），随后各问题的检索并行执行；
+大模型调用（多查询改写和生成回答）共用一个并发上限；每完成一个问题就输出一行 JSONL 结果，附带各阶段耗时。
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List
+
+from retrievers import embed_queries
+
+# 并行处理的问题数（检索并行度）
+BATCH_WORKERS = int(os.getenv("RAG_BATCH_WORKERS", "8"))
+# 同时进行的大模型调用（改写查询、生成回答）数
+BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", "4"))
+# 单次批量请求的问题数上限
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "1000"))
+# 预先批量嵌入时每次调用的问题数
+EMBED_CHUNK = 256
+
+
+def parse_questions(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """解析 JSONL 问题列表，格式错误时抛出 ValueError（带行号）"""
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {number} 行不是合法的 JSON: {e}")
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not str(item.get("question") or "").strip():
+            raise ValueError(f"第 {number} 行缺少 question 字段")
+        item.setdefault("id", str(len(items)))
+        items.append(item)
+    return items
+
+
+def run_batch(rag_chain, items: List[Dict[str, Any]], workers: int = BATCH_WORKERS,
+              llm_concurrency: int = BATCH_LLM_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """
+    批量问答，按完成顺序逐个产出结果
+    第一个产出的是 {"type": "batch", ...} 汇总信息（问题数、批量嵌入耗时），之后每个问题一条结果
+    """
+    start = time.perf_counter()
+    questions = [item["question"] for item in items]
+    vectors = []
+    for offset in range(0, len(questions), EMBED_CHUNK):
+        vectors.extend(embed_queries(rag_chain.embedding_model, questions[offset:offset + EMBED_CHUNK]))
+    yield {"type": "batch", "questions": len(items),
+           "embed_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    generation_slot = threading.BoundedSemaphore(llm_concurrency)
+
+    def answer(index, item):
+        try:
+            result = rag_chain.ask_question(item["question"], item.get("sources"),
+                                            generation_slot=generation_slot, vector=vectors[index])
+            return {"index": index, "id": item["id"], "question": item["question"],
+                    "answer": result["result"], "sources": result["sources"],
+                    "timings": result["timings"], "cached": result.get("cached", False)}
+        except Exception as e:
+            return {"index": index, "id": item["id"], "question": item["question"],
+                    "error": f"{type(e).__name__}: {e}"}
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-batch")
+    try:
+        futures = [pool.submit(answer, index, item) for index, item in enumerate(items)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # 调用方提前停止（例如客户端断开）时取消尚未开始的问题，并等待正在执行的问题结束，
+        # 在此之前批次占用的 /ask 名额不会释放
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,82 @@
+"""
+嵌入吞吐量基准测试
+生成一份长度不一的合成中文语料，在不同的批大小、是否按长度排序、torch 线程数下
+嵌入全部分块，输出每秒分块数，用于为纯 CPU 机器挑选 RAG_EMBED_BATCH_SIZE /
+RAG_EMBED_SORT / RAG_EMBED_THREADS。
+使用方法：
+    python bench_embedding.py --model E:\\path\\to\\m3e-base --chunks 2000
+    python bench_embedding.py --model ... --batch-sizes 16 32 64 --threads 4 8
+"""
+
+import os
+import time
+import random
+import argparse
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from embedding_pipeline import BatchedEmbeddings, configure_torch_threads
+
+# 合成语料的词表
+WORDS = ["理想", "学习", "模型", "向量", "检索", "文档", "问题", "回答", "系统", "数据",
+         "训练", "推理", "知识", "方法", "结果", "分析", "实验", "性能", "内存", "延迟",
+         "embedding", "Qdrant", "LangChain", "CPU", "batch"]
+
+
+def synthetic_chunks(count, min_len, max_len, seed=0):
+    """生成 count 个长度在 [min_len, max_len] 字符之间的文本块"""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        target = rng.randint(min_len, max_len)
+        text = ""
+        while len(text) < target:
+            text += rng.choice(WORDS) + rng.choice(["，", "。", "", ""])
+        chunks.append(text[:target])
+    return chunks
+
+
+def run(base, chunks, batch_size, sort_by_length):
+    """嵌入全部分块，返回每秒分块数"""
+    base.encode_kwargs["batch_size"] = batch_size
+    embeddings = BatchedEmbeddings(base, batch_size=batch_size, sort_by_length=sort_by_length)
+    start = time.perf_counter()
+    embeddings.embed_documents(chunks)
+    return len(chunks) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="嵌入吞吐量基准测试")
+    parser.add_argument("--model", required=True, help="嵌入模型路径，例如 m3e-base")
+    parser.add_argument("--chunks", type=int, default=1000, help="合成分块数")
+    parser.add_argument("--min-len", type=int, default=20, help="分块最短字符数")
+    parser.add_argument("--max-len", type=int, default=200, help="分块最长字符数")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks, args.min_len, args.max_len)
+    base = HuggingFaceEmbeddings(
+        model_name=args.model,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+    # 预热，排除首次调用的初始化开销
+    base.embed_documents(chunks[:8])
+
+    print(f"{'线程':>4} | {'批大小':>6} | {'排序':>4} | {'分块/秒':>8}")
+    best = None
+    for threads in args.threads:
+        configure_torch_threads(threads)
+        for batch_size in args.batch_sizes:
+            for sort_by_length in (False, True):
+                rate = run(base, chunks, batch_size, sort_by_length)
+                print(f"{threads:>6} | {batch_size:>9} | {'是' if sort_by_length else '否':>4} | {rate:>10.1f}")
+                if best is None or rate > best[0]:
+                    best = (rate, threads, batch_size, sort_by_length)
+
+    rate, threads, batch_size, sort_by_length = best
+    print("-" * 40)
+    print(f"最佳: {rate:.1f} 分块/秒")
+    print(f"RAG_EMBED_THREADS={threads} RAG_EMBED_BATCH_SIZE={batch_size} "
+          f"RAG_EMBED_SORT={1 if sort_by_length else 0}")
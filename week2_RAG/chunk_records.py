@@ -0,0 +1,69 @@
+"""
+统一的分块记录
+所有格式的文档切分后都带有相同的元数据：来源文件、页码、字符偏移、内容哈希和分块ID。
+内容完全相同的分块（例如多个文件里重复的段落）只存一个向量，
+其出现位置记录在 locations 中，来源文件列表记录在 sources 中，用于按文件过滤和删除。
+"""
+
+import uuid
+import hashlib
+from typing import Dict, List, Tuple
+
+from langchain.schema import Document
+
+# 分块ID = 由内容哈希派生的 UUID，相同内容总是映射到同一个向量点
+CHUNK_NAMESPACE = uuid.UUID("6f1c2a52-8d0e-4b7a-9a57-3d4c1e0b9f21")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(text_hash: str) -> str:
+    return str(uuid.uuid5(CHUNK_NAMESPACE, text_hash))
+
+
+def make_chunks(documents: List[Document], splitter) -> List[Document]:
+    """
+    切分文档并生成统一元数据
+    splitter 需要以 add_start_index=True 创建，用于记录字符偏移
+    """
+    chunks = []
+    for chunk in splitter.split_documents(documents):
+        text_hash = content_hash(chunk.page_content)
+        start = chunk.metadata.pop("start_index", None)
+        location = {
+            "source": chunk.metadata.get("source"),
+            "page": chunk.metadata.get("page"),
+            "start_index": start,
+            "end_index": start + len(chunk.page_content) if start is not None and start >= 0 else None,
+        }
+        chunk.metadata.update(location)
+        chunk.metadata.update({
+            "chunk_id": chunk_id(text_hash),
+            "content_hash": text_hash,
+            "sources": [location["source"]],
+            "locations": [location],
+        })
+        chunks.append(chunk)
+    return chunks
+
+
+def merge_locations(metadata: Dict, locations: List[Dict]):
+    """把新的出现位置合并进分块元数据（去重），并更新来源文件列表"""
+    for location in locations:
+        if location not in metadata["locations"]:
+            metadata["locations"].append(location)
+    metadata["sources"] = sorted({location["source"] for location in metadata["locations"]})
+
+
+def dedupe_chunks(chunks: List[Document]) -> Tuple[List[Document], int]:
+    """合并同一批次中内容相同的分块，返回 (去重后的分块, 被合并的分块数)"""
+    unique: Dict[str, Document] = {}
+    for chunk in chunks:
+        existing = unique.get(chunk.metadata["chunk_id"])
+        if existing is None:
+            unique[chunk.metadata["chunk_id"]] = chunk
+        else:
+            merge_locations(existing.metadata, chunk.metadata["locations"])
+    return list(unique.values()), len(chunks) - len(unique)
@@ -0,0 +1,69 @@
+"""
+分块策略
+character: 按字符数切分（原来的 RecursiveCharacterTextSplitter 200/50）
+token:     按嵌入模型分词器的 token 数切分，分块长度与模型的实际输入长度一致
+sentence:  优先在段落、句末标点（。！？；）处断开的字符切分，适合中文
+分块大小和重叠对索引规模与召回率的影响可用 eval_chunking.py 评估。
+"""
+
+import os
+from functools import lru_cache
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+CHUNK_STRATEGIES = ("character", "token", "sentence")
+
+CHUNK_STRATEGY = os.getenv("RAG_CHUNK_STRATEGY", "character")
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "200"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "50"))
+
+# 句子感知切分的分隔符（正则），零宽断言使标点保留在前一句末尾
+SENTENCE_SEPARATORS = [
+    "\n\n",
+    "\n",
+    r"(?<=[。！？!?])",
+    r"(?<=[；;])",
+    r"(?<=[，,、])",
+    " ",
+    "",
+]
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_path):
+    """加载嵌入模型目录中的分词器"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_path)
+
+
+def create_splitter(strategy=CHUNK_STRATEGY, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                    model_path=None):
+    """
+    按策略创建文本切分器，均记录分块的起始字符偏移
+    Args:
+        strategy: character / token / sentence
+        chunk_size: 分块大小（token 策略为 token 数，其余为字符数）
+        chunk_overlap: 相邻分块的重叠大小
+        model_path: 嵌入模型路径，token 策略需要用它的分词器计数
+    """
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"不支持的分块策略: {strategy}，可选: {', '.join(CHUNK_STRATEGIES)}")
+    if strategy == "token":
+        if not model_path:
+            raise ValueError("token 分块策略需要嵌入模型路径")
+        return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            load_tokenizer(model_path),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
+        )
+    if strategy == "sentence":
+        return RecursiveCharacterTextSplitter(
+            separators=SENTENCE_SEPARATORS,
+            is_separator_regex=True,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
+        )
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                          add_start_index=True)
@@ -0,0 +1,102 @@
+"""
+并行流式文档加载
+PDF 解析是 CPU 密集的，文件在进程池中并行解析，按文件逐个交给分块和嵌入，
+同时在途的文件数有上限，内存占用不随语料规模增长。无法读取的文件记录下来并跳过，不会中断整个入库。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+from langchain.schema import Document
+
+from vector_index import SUPPORTED_EXTENSIONS
+
+# 解析文件的进程数，1 表示在当前进程中顺序解析
+LOAD_WORKERS = int(os.getenv("RAG_LOAD_WORKERS", str(os.cpu_count() or 1)))
+# 同时在途（解析中或已解析待嵌入）的文件数上限，0 表示进程数的两倍
+LOAD_MAX_PENDING = int(os.getenv("RAG_LOAD_MAX_PENDING", "0"))
+
+
+def load_file(base_dir, file):
+    """加载单个文件，metadata.source 统一为相对 base_dir 的文件名，用于按文件删除向量"""
+    file_path = os.path.join(base_dir, file)
+    if file.endswith(".pdf"):
+        documents = PyPDFLoader(file_path).load()
+    elif file.endswith(".docx"):
+        documents = Docx2txtLoader(file_path).load()
+    elif file.endswith(".txt"):
+        with open(file_path, encoding="utf-8") as f:
+            documents = [Document(page_content=f.read())]
+    else:
+        return []
+    for doc in documents:
+        doc.metadata["source"] = file
+        doc.metadata["file_path"] = file_path
+    return documents
+
+
+def list_files(base_dir):
+    """返回目录下所有受支持的文件名"""
+    return [file for file in sorted(os.listdir(base_dir)) if file.endswith(SUPPORTED_EXTENSIONS)]
+
+
+class StreamingLoader:
+    """按文件流式产出文档，解析失败的文件记录在 failures 中"""
+
+    def __init__(self, base_dir, workers=LOAD_WORKERS, max_pending=LOAD_MAX_PENDING):
+        """
+        初始化加载器
+        Args:
+            base_dir: 文档目录
+            workers: 解析进程数
+            max_pending: 同时在途的文件数上限
+        """
+        self.base_dir = base_dir
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * 2
+        self.failures = {}
+
+    def iter_files(self, files):
+        """
+        依次产出 (文件名, 文档列表)，顺序按解析完成的先后
+        生成器被消费得慢时不会继续提交新文件，保证在途文件数不超过 max_pending
+        """
+        if self.workers == 1 or len(files) <= 1:
+            for file in files:
+                documents = self._load_safely(file)
+                if documents is not None:
+                    yield file, documents
+            return
+
+        pending = {}
+        queue = iter(files)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while len(pending) < self.max_pending:
+                    file = next(queue, None)
+                    if file is None:
+                        break
+                    pending[pool.submit(load_file, self.base_dir, file)] = file
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = pending.pop(future)
+                    try:
+                        documents = future.result()
+                    except Exception as e:
+                        self._record_failure(file, e)
+                        continue
+                    yield file, documents
+
+    def _load_safely(self, file):
+        try:
+            return load_file(self.base_dir, file)
+        except Exception as e:
+            self._record_failure(file, e)
+            return None
+
+    def _record_failure(self, file, error):
+        self.failures[file] = f"{type(error).__name__}: {error}"
+        print(f"跳过无法读取的文件 {file}: {self.failures[file]}")
@@ -0,0 +1,201 @@
+"""
+嵌入向量缓存
+按 (模型路径, 是否归一化, 文本类型, 文本哈希) 对向量做内容寻址缓存，保存在 SQLite 中（float32）。
+重建索引或修改文件后，内容没变的分块不再调用模型。
+查询向量只保存在有上限的内存 LRU 中，不写入磁盘：用户的问题各不相同，持久化只会让数据库无限增长。
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "index", "embeddings.db")
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """SQLite 向量缓存，每个线程一个连接"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 {键: 向量}"""
+        found = {}
+        conn = self._connect()
+        # SQLite 单条语句的参数个数有限，分批查询
+        for offset in range(0, len(keys), 500):
+            batch = keys[offset:offset + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = _unpack(blob)
+        return found
+
+    def set_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, _pack(vector)) for key, vector in items.items()]
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+
+class CachedEmbeddings(Embeddings):
+    """在嵌入模型外层加一层内容寻址缓存"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, namespace: Dict,
+                 max_query_entries: int = 1000):
+        """
+        初始化缓存嵌入
+        Args:
+            embeddings: 实际的嵌入模型
+            cache: 向量缓存
+            namespace: 影响向量结果的模型参数（模型路径、是否归一化等），参与缓存键计算
+            max_query_entries: 内存中缓存的查询向量条数
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.namespace = json.dumps(namespace, sort_keys=True, ensure_ascii=False)
+        self.max_query_entries = max_query_entries
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, kind: str, text: str) -> str:
+        raw = f"{self.namespace}\0{kind}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.make_key("doc", text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+
+        # 同一批中重复的文本只嵌入一次
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.set_many(computed)
+            found.update(computed)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量计算查询向量：先查内存 LRU，其余一次性交给模型"""
+        keys = [self.make_key("query", text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._queries.get(key)
+                if vector is not None:
+                    self._queries.move_to_end(key)
+                    found[key] = vector
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            embed = getattr(self.embeddings, "embed_queries", None)
+            queries = list(missing.values())
+            vectors = embed(queries) if embed else [self.embeddings.embed_query(q) for q in queries]
+            found.update(zip(missing.keys(), vectors))
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            for key in keys:
+                self._queries[key] = found[key]
+                self._queries.move_to_end(key)
+            while len(self._queries) > self.max_query_entries:
+                self._queries.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        inner = getattr(self.embeddings, "stats", None)
+        if inner is not None:
+            stats.update(inner())
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+        reset = getattr(self.embeddings, "reset_stats", None)
+        if reset is not None:
+            reset()
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    根据环境变量创建向量缓存，未启用时返回None
+    RAG_EMBED_CACHE: 是否启用（默认1）
+    RAG_EMBED_CACHE_DB: SQLite 路径，默认 week2_RAG/index/embeddings.db
+    """
+    if os.getenv("RAG_EMBED_CACHE", "1") != "1":
+        return None
+    return EmbeddingCache(os.getenv("RAG_EMBED_CACHE_DB") or DEFAULT_DB)
+
+
+def with_cache(embeddings: Embeddings, model_path: str, normalize_embeddings: bool) -> Embeddings:
+    """按环境变量为嵌入模型加上缓存，未启用缓存时原样返回"""
+    cache = create_embedding_cache()
+    if cache is None:
+        return embeddings
+    namespace = {"model": model_path, "normalize_embeddings": normalize_embeddings}
+    return CachedEmbeddings(embeddings, cache, namespace)
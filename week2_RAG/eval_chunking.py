@@ -0,0 +1,104 @@
+"""
+分块策略离线评估
+对每组 (策略, 分块大小, 重叠) 在内存中重建索引，输出分块数、索引大小、入库耗时和 recall@k，
+用于在索引规模（嵌入次数）和检索质量之间权衡。不调用大模型。
+标注问题集为 JSONL，每行一个问题，至少包含以下之一：
+    {"question": "理想是什么", "sources": ["理想.txt"]}    命中任一来源文件的分块即算召回
+    {"question": "理想是什么", "answer": "理想是..."}      分块包含答案原文即算召回
+使用方法：
+    python eval_chunking.py --model E:\\path\\to\\m3e-base --questions questions.jsonl
+    python eval_chunking.py --model ... --questions ... --strategies character sentence \\
+        --sizes 200 300 --overlaps 0 30 --k 3 5
+"""
+
+import os
+import json
+import time
+import argparse
+
+from chunking import CHUNK_STRATEGIES
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(question, doc):
+    sources = question.get("sources")
+    if sources and set(sources) & set(doc.metadata.get("sources") or [doc.metadata.get("source")]):
+        return True
+    answer = question.get("answer")
+    return bool(answer) and answer in doc.page_content
+
+
+def index_size(vectorstore):
+    """返回 (向量点数, 估算字节数)：向量按 float32 计，加上分块原文"""
+    client, collection = vectorstore.client, vectorstore.collection_name
+    points, text_bytes, dimension, offset = 0, 0, 0, None
+    while True:
+        batch, offset = client.scroll(collection, limit=256, offset=offset,
+                                      with_payload=True, with_vectors=True)
+        for point in batch:
+            points += 1
+            dimension = len(point.vector)
+            text_bytes += len((point.payload.get("page_content") or "").encode("utf-8"))
+        if offset is None:
+            break
+    return points, points * dimension * 4 + text_bytes
+
+
+def evaluate(rag_chain, embedding_model, questions, ks):
+    """重建索引并计算各项指标"""
+    start = time.perf_counter()
+    rag_chain.create_vectorstore(embedding_model)
+    ingest_seconds = time.perf_counter() - start
+    points, size = index_size(rag_chain.vectorstore)
+
+    hits = {k: 0 for k in ks}
+    for question in questions:
+        docs = rag_chain.vectorstore.similarity_search(question["question"], k=max(ks))
+        for k in ks:
+            if any(is_relevant(question, doc) for doc in docs[:k]):
+                hits[k] += 1
+    recall = {k: hits[k] / len(questions) if questions else 0.0 for k in ks}
+    return points, size, ingest_seconds, recall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分块策略离线评估")
+    parser.add_argument("--model", required=True, help="嵌入模型路径，例如 m3e-base")
+    parser.add_argument("--questions", required=True, help="标注问题集（JSONL）")
+    parser.add_argument("--docs", default=os.path.join(os.path.dirname(__file__), "documents"),
+                        help="文档目录")
+    parser.add_argument("--strategies", nargs="+", default=list(CHUNK_STRATEGIES), choices=CHUNK_STRATEGIES)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 300, 500])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 50])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="计算 recall@k 的 k 值")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="使用向量缓存（入库耗时不再反映真实嵌入开销）")
+    args = parser.parse_args()
+
+    if not args.use_cache:
+        os.environ["RAG_EMBED_CACHE"] = "0"
+    from RAGC import RAGChain
+
+    questions = load_questions(args.questions)
+    rag_chain = RAGChain(args.docs, args.model, api_key=None)
+    embedding_model = rag_chain.initialize_embedding_model()
+
+    ks = sorted(args.k)
+    header = " | ".join([f"{'策略':<9}", f"{'大小':>4}", f"{'重叠':>4}", f"{'分块数':>6}",
+                         f"{'索引KB':>8}", f"{'入库秒':>7}"] + [f"R@{k:<3}" for k in ks])
+    print(header)
+    print("-" * 80)
+    for strategy in args.strategies:
+        for size in args.sizes:
+            for overlap in args.overlaps:
+                if overlap >= size:
+                    continue
+                rag_chain.chunk_strategy, rag_chain.chunk_size, rag_chain.chunk_overlap = strategy, size, overlap
+                points, size_bytes, seconds, recall = evaluate(rag_chain, embedding_model, questions, ks)
+                row = [f"{strategy:<11}", f"{size:>6}", f"{overlap:>6}", f"{points:>9}",
+                       f"{size_bytes / 1024:>10.1f}", f"{seconds:>9.2f}"]
+                print(" | ".join(row + [f"{recall[k]:.3f}" for k in ks]))
@@ -1,18 +1,27 @@
+import anyio
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from pydantic import BaseModel
 from RAGC import RAGChain
+from ask_limiter import AskLimiter, Overloaded
+from batch_qa import parse_questions, run_batch, BATCH_WORKERS, BATCH_MAX_QUESTIONS
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from typing import List, Optional
+from contextlib import asynccontextmanager
 
 
 import os
-
-app = FastAPI()
+import hmac
+import json
+import time
+import threading
 
 # 定义请求模型
 class QuestionRequest(BaseModel):
     question: str
+    # 只在这些文件（documents 目录下的文件名）中检索，为空时检索全部文档
+    sources: Optional[List[str]] = None
 
 # 初始化 RAGChain
 base_dir = os.path.join(os.path.dirname(__file__), "documents")
@@ -20,22 +29,261 @@ embedding_model_path = r"E:\0projects\summer_school\embedding_models\moka\m3e-ba
 
 load_dotenv()
 api_key = os.getenv("DEEPSEEK_API_KEY")
+# 向量索引持久化目录，重启时直接加载并增量同步文档变化，嵌入或分块配置变化时自动重建
+index_dir = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "index"))
+# 文档目录轮询间隔（秒），0 表示不启动监视线程，只能通过 /admin/reindex 触发
+watch_interval = float(os.getenv("RAG_WATCH_INTERVAL", "0"))
+# /admin/reindex 需要携带与之相同的 X-Admin-Token 请求头；未设置时管理接口不可用
+admin_token = os.getenv("RAG_ADMIN_TOKEN")
+
+# 服务未就绪时 /ask 返回 503，建议客户端等待的秒数
+startup_retry_after = int(os.getenv("RAG_STARTUP_RETRY_AFTER", "5"))
+
+rag_chain = RAGChain(base_dir, embedding_model_path, api_key, index_dir=index_dir)
+# /ask 的并发上限、排队上限和排队超时由 RAG_ASK_MAX_IN_FLIGHT / RAG_ASK_MAX_QUEUE / RAG_ASK_QUEUE_TIMEOUT 配置
+ask_limiter = AskLimiter()
+
+
+class StartupState:
+    """后台初始化的进度：status 为 starting / ready / failed，stages 记录各阶段耗时（毫秒）"""
+
+    def __init__(self):
+        self.status = "starting"
+        self.stage = None
+        self.stages = {}
+        self.error = None
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def run(self, name, func, *args):
+        with self._lock:
+            self.stage = name
+        start = time.perf_counter()
+        result = func(*args)
+        with self._lock:
+            self.stages[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "stage": self.stage,
+                "stages_ms": dict(self.stages),
+                "error": self.error,
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+            }
+
+
+startup_state = StartupState()
+
+
+def initialize_rag_chain():
+    """依次完成各初始化阶段（在后台线程中运行），失败时记录错误，服务保持未就绪"""
+    try:
+        embedding_model = startup_state.run("embedding_model", rag_chain.initialize_embedding_model)
+        startup_state.run("vectorstore", rag_chain.load_or_create_vectorstore, embedding_model)
+        startup_state.run("reranker", rag_chain.initialize_reranker)
+        startup_state.run("chat_model", rag_chain.initialize_chat_model)
+        startup_state.run("qa_chain", rag_chain.create_qa_chain)
+        if watch_interval > 0:
+            rag_chain.start_watcher(watch_interval)
+        startup_state.status = "ready"
+        print(f"RAG service ready: {startup_state.snapshot()['stages_ms']}")
+    except Exception as e:
+        startup_state.error = f"{type(e).__name__}: {e}"
+        startup_state.status = "failed"
+        print(f"RAG 初始化失败（阶段 {startup_state.stage}）: {startup_state.error}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 索引构建放到后台线程，服务启动后立即可以接受连接、返回页面和健康检查；
+    # 使用守护线程，初始化未完成时关闭服务也不会被阻塞
+    threading.Thread(target=initialize_rag_chain, name="rag-startup", daemon=True).start()
+    yield
+    rag_chain.stop_watcher()
+    ask_limiter.executor.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def require_ready():
+    """服务未就绪时返回 503 和 Retry-After"""
+    if startup_state.ready:
+        return
+    state = startup_state.snapshot()
+    detail = "服务正在初始化，请稍后重试" if state["status"] == "starting" else f"服务初始化失败: {state['error']}"
+    raise HTTPException(status_code=503, detail=detail,
+                        headers={"Retry-After": str(startup_retry_after)})
+
+
+@app.get("/healthz")
+async def healthz():
+    """存活检查：进程能响应即返回 200"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """就绪检查：初始化完成返回 200，否则返回 503 和当前进度"""
+    state = startup_state.snapshot()
+    if startup_state.ready:
+        return state
+    return JSONResponse(status_code=503, content=state,
+                        headers={"Retry-After": str(startup_retry_after)})
 
-rag_chain = RAGChain(base_dir, embedding_model_path, api_key)
-rag_chain.load_documents()
-embedding_model = rag_chain.initialize_embedding_model()
-rag_chain.create_vectorstore(embedding_model)
-rag_chain.initialize_chat_model()
-rag_chain.create_qa_chain()
 
 @app.post("/ask")
 async def ask_question(request: QuestionRequest):
+    require_ready()
     try:
-        result = rag_chain.ask_question(request.question)
+        result = await ask_limiter.run(rag_chain.ask_question, request.question, request.sources)
         return {"answer": result}
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=f"服务繁忙: {e}", headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def sse_event(payload: dict) -> str:
+    """将字典编码为一条Server-Sent Events消息"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """
+    占用 /ask 名额的流式响应：响应结束时关闭事件流、释放名额。
+    客户端在响应体开始发送前断开时，包装事件流的生成器根本不会启动，它的 finally 不会执行，
+    Starlette 也不会运行 background，所以在这里无论如何都关闭一次
+    """
+
+    def __init__(self, content, events, **kwargs):
+        super().__init__(content, **kwargs)
+        self.events = events
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # 请求被取消时也要等生成器退出（批量问答要等正在执行的问题结束）再释放名额
+            with anyio.CancelScope(shield=True):
+                await self.events.aclose()
+
+
+async def sse_answer(first, events):
+    """
+    把 stream_answer 的事件包装为SSE事件流：
+    {"sources": [...]} -> 若干 {"token": ...} -> {"done": true, "timings": ...}，出错时发送 {"error": ...}
+    """
+    try:
+        kind, data = first
+        yield sse_event({kind: data})
+        async for kind, data in events:
+            if kind == "done":
+                yield sse_event({"done": True, **data})
+            else:
+                yield sse_event({kind: data})
+    except Exception as e:
+        yield sse_event({"error": str(e)})
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    流式问答：检索完成后立即推送来源（文件、页码、得分），再逐个推送回答的token
+    """
+    require_ready()
+    events = ask_limiter.stream(rag_chain.stream_answer, request.question, request.sources)
+    # 等到检索完成（第一个事件）再返回响应，排队失败和检索出错仍能以状态码返回
+    try:
+        first = await events.__anext__()
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=f"服务繁忙: {e}", headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return LimitedStreamingResponse(
+        sse_answer(first, events),
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲，保证token及时送达
+        }
+    )
+
+
+@app.post("/ask/batch")
+async def ask_batch(request: Request):
+    """
+    批量问答：请求体为 JSONL（每行 {"id", "question", "sources"}），
+    响应为 JSONL 流，首行是批次汇总，之后每完成一个问题输出一行（按完成顺序，带 index 和 id）
+    批次按内部的并行数占用 /ask 的并发名额（最多 RAG_BATCH_WORKERS 个，排队拿到一个后再占用当时空闲的名额），
+    批次内的大模型调用并发数由 RAG_BATCH_LLM_CONCURRENCY 控制
+    """
+    require_ready()
+    body = (await request.body()).decode("utf-8")
+    try:
+        items = parse_questions(body.splitlines())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="没有问题")
+    if len(items) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"单次最多 {BATCH_MAX_QUESTIONS} 个问题")
+
+    events = ask_limiter.stream(run_batch, rag_chain, items, slots=BATCH_WORKERS)
+    try:
+        first = await events.__anext__()
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=f"服务繁忙: {e}", headers={"Retry-After": "1"})
+
+    async def jsonl():
+        try:
+            yield json.dumps(first, ensure_ascii=False) + "\n"
+            async for result in events:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    return LimitedStreamingResponse(jsonl(), events, media_type="application/x-ndjson",
+                                    headers={"X-Accel-Buffering": "no"})
+
+
+@app.get("/metrics/ask")
+async def ask_metrics():
+    """/ask 的并发、队列深度和延迟统计"""
+    return ask_limiter.metrics()
+
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """语义答案缓存的命中率等统计，未启用时返回 enabled: false"""
+    if rag_chain.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_chain.answer_cache.stats()}
+
+@app.post("/admin/reindex")
+def reindex(full: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """增量同步文档目录；full=true 时全量重建索引（写入新集合后再切换，重建期间 /ask 继续使用旧索引）"""
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="未配置 RAG_ADMIN_TOKEN，管理接口已禁用")
+    if not hmac.compare_digest((x_admin_token or "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="无效的管理令牌")
+    require_ready()
+    try:
+        if full:
+            rag_chain.rebuild_index()
+            return {"rebuilt": True}
+        return rag_chain.sync_documents()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -0,0 +1,140 @@
+"""
+BM25 词法索引
+与向量索引并存，用于召回产品编号、人名等精确词项（向量检索对这类查询不敏感）。
+中文按单字 + 相邻二字切分，英文和数字按连续的字母数字串（允许中间带 - _ .）切分并转小写，
+不依赖分词库。索引在内存中，启动或全量重建时从向量库整体构建，增量同步时只替换变化文件的分块。
+"""
+
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+# 连续的中日韩字符，或字母数字串（如 AB-1234、v1.2）
+TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[0-9A-Za-z]+(?:[-_.][0-9A-Za-z]+)*")
+CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文输出单字和二字组，其余输出小写的字母数字串"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        term = match.group()
+        if CJK_PATTERN.match(term):
+            tokens.extend(term)
+            tokens.extend(term[i:i + 2] for i in range(len(term) - 1))
+        else:
+            tokens.append(term.lower())
+    return tokens
+
+
+class BM25Index:
+    """
+    内存 BM25 倒排索引，分块按 chunk_id 存放，并记录每个源文件包含哪些分块，
+    增量同步时只替换变化文件的分块。检索与更新共用一把锁
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._docs: Dict[str, Document] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._by_source: Dict[str, Set[str]] = defaultdict(set)
+        self._total_length = 0
+
+    def build(self, documents: Iterable[Document]):
+        """用全部分块重建索引"""
+        with self._lock:
+            self._reset()
+            for doc in documents:
+                self._add(doc)
+
+    def replace_sources(self, sources: Iterable[str], documents: Iterable[Document]):
+        """
+        增量更新：移除 sources 中各文件原有的分块，再加入 documents
+        documents 应包含这些文件现在的全部分块，以及 chunk_ids(sources) 中仍然存在的分块（共享分块的来源可能已变化）
+        """
+        with self._lock:
+            for source in sources:
+                for chunk_id in list(self._by_source.get(source, ())):
+                    self._remove(chunk_id)
+            for doc in documents:
+                self._add(doc)
+
+    def chunk_ids(self, sources: Iterable[str]) -> List[str]:
+        """当前索引中属于这些文件的分块ID"""
+        with self._lock:
+            return sorted(set().union(*(self._by_source.get(source, ()) for source in sources)))
+
+    def _add(self, doc: Document):
+        """加入一个分块，已存在时先移除旧版本（调用方需持有锁）"""
+        chunk_id = doc.metadata["chunk_id"]
+        if chunk_id in self._docs:
+            self._remove(chunk_id)
+        counts = Counter(tokenize(doc.page_content))
+        for term, tf in counts.items():
+            self._postings[term][chunk_id] = tf
+        for source in doc.metadata.get("sources") or []:
+            self._by_source[source].add(chunk_id)
+        self._docs[chunk_id] = doc
+        self._terms[chunk_id] = counts
+        self._lengths[chunk_id] = sum(counts.values())
+        self._total_length += self._lengths[chunk_id]
+
+    def _remove(self, chunk_id: str):
+        """移除一个分块（调用方需持有锁）"""
+        doc = self._docs.pop(chunk_id)
+        counts = self._terms.pop(chunk_id)
+        for term in counts:
+            matches = self._postings[term]
+            del matches[chunk_id]
+            if not matches:
+                del self._postings[term]
+        for source in doc.metadata.get("sources") or []:
+            ids = self._by_source.get(source)
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self._by_source[source]
+        self._total_length -= self._lengths.pop(chunk_id)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def search(self, query: str, k: int = 4,
+               sources: Optional[List[str]] = None) -> List[Tuple[Document, float]]:
+        """返回得分最高的 k 个分块，指定 sources 时只返回来自这些文件的分块"""
+        with self._lock:
+            if not self._docs:
+                return []
+            total = len(self._docs)
+            avg_length = self._total_length / total
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                matches = self._postings.get(term)
+                if not matches:
+                    continue
+                idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+                for chunk_id, tf in matches.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for chunk_id, score in ranked:
+                doc = self._docs[chunk_id]
+                if sources and not set(sources) & set(doc.metadata.get("sources") or []):
+                    continue
+                results.append((doc, score))
+                if len(results) >= k:
+                    break
+            return results
@@ -0,0 +1,96 @@
+"""
+交叉编码器重排序
+检索先取 top-N 个候选，再用本地交叉编码器（例如 bce-reranker-base_v1）在 CPU 上分批打分，
+只把得分最高的 top-k 个分块放进提示词。超过时间预算时放弃重排序，按原来的检索顺序截取，
+保证重排序不会拖慢 /ask 的尾延迟。
+"""
+
+import os
+import time
+import threading
+from typing import List, Optional, Tuple
+
+from langchain.schema import Document
+
+# 交叉编码器模型路径，为空时不启用重排序
+RERANKER_MODEL = os.getenv("RAG_RERANKER_MODEL", "")
+# 参与重排序的候选数
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RAG_RERANK_BATCH_SIZE", "16"))
+# 重排序的时间预算（毫秒）
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "800"))
+
+
+class CrossEncoderReranker:
+    """本地交叉编码器，首次使用时加载模型"""
+
+    def __init__(self, model_path: str, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: float = RERANK_BUDGET_MS, max_length: int = 512):
+        """
+        初始化重排序器
+        Args:
+            model_path: 交叉编码器模型路径
+            batch_size: 每批打分的候选数
+            budget_ms: 时间预算（毫秒），超时后按原顺序返回
+            max_length: 问题 + 分块的最大 token 数
+        """
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_path, device="cpu", max_length=self.max_length)
+        return self._model
+
+    def load(self):
+        """预先加载模型，避免第一个请求承担加载开销"""
+        return self.model
+
+    def rerank(self, query: str, docs: List[Document], top_k: int) -> Tuple[List[Document], bool]:
+        """
+        对候选分块重新排序
+        Returns:
+            tuple: (前 top_k 个分块, 是否完成了重排序)；超时时返回原顺序的前 top_k 个
+        """
+        if len(docs) <= 1:
+            return docs[:top_k], True
+        # 每批打分前检查预算，单批本身不可中断，批越小超时越精确
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        scores: List[float] = []
+        for offset in range(0, len(docs), self.batch_size):
+            if time.perf_counter() > deadline:
+                with self._lock:
+                    self.fallbacks += 1
+                return docs[:top_k], False
+            batch = docs[offset:offset + self.batch_size]
+            scores.extend(float(score) for score in
+                          self.model.predict([(query, doc.page_content) for doc in batch],
+                                             batch_size=self.batch_size))
+
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)[:top_k]
+        # 检索结果可能是 BM25 索引中共享的对象，复制后再写入得分
+        reranked = [Document(page_content=docs[i].page_content,
+                             metadata={**docs[i].metadata, "rerank_score": round(scores[i], 4)})
+                    for i in order]
+        with self._lock:
+            self.reranked += 1
+        return reranked, True
+
+
+def create_reranker() -> Optional[CrossEncoderReranker]:
+    """根据环境变量创建重排序器，未配置 RAG_RERANKER_MODEL 时返回None"""
+    if not RERANKER_MODEL:
+        return None
+    if not os.path.exists(RERANKER_MODEL):
+        raise FileNotFoundError(f"重排序模型路径 {RERANKER_MODEL} 不存在，请检查路径或下载模型")
+    return CrossEncoderReranker(RERANKER_MODEL)
@@ -0,0 +1,172 @@
+"""
+检索器
+plain:       只做一次向量检索
+multi_query: 先让大模型改写出多个查询，所有查询的向量在一次嵌入调用中批量计算，
+             各查询的向量检索并发执行，结果用倒数排名融合（RRF）合并
+hybrid:      向量检索与 BM25 词法检索各取 fetch_k 个候选，用 RRF 合并，
+             不需要额外的大模型调用，就能召回精确词项（编号、人名）类的查询
+检索器可以接收一个 timings 字典，按阶段记录耗时（秒），由 /ask 返回；
+也可以接收预先算好的问题向量（批量问答一次嵌入全部问题），以及限制大模型调用并发数的 llm_slot。
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT
+from langchain.schema import BaseRetriever, Document
+
+from vector_index import source_filter
+
+RETRIEVAL_MODES = ("plain", "multi_query", "hybrid")
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "multi_query")
+# 最终送入提示词的分块数和每一路检索的候选数
+RETRIEVAL_K = int(os.getenv("RAG_RETRIEVAL_K", "4"))
+RETRIEVAL_FETCH_K = int(os.getenv("RAG_RETRIEVAL_FETCH_K", "20"))
+# 并发执行向量检索的线程数
+SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "8"))
+
+# RRF 的平滑常数，常用取值 60
+RRF_K = 60
+
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="rag-search")
+
+
+def chunk_key(doc: Document) -> str:
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """
+    按 sum(1 / (k + 排名)) 合并多路排序结果
+    返回的分块是副本（BM25 索引中的分块对象是共享的），metadata.score 为融合得分
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [Document(page_content=docs[key].page_content,
+                     metadata={**docs[key].metadata, "score": round(scores[key], 6)})
+            for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def embed_queries(embeddings, queries: List[str]) -> List[List[float]]:
+    """一次调用计算多个查询的向量，嵌入模型没有批量查询接口时按文档方式批量计算"""
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(queries)
+    return embeddings.embed_documents(queries)
+
+
+class TimedRetriever(BaseRetriever):
+    """按阶段记录耗时的检索器基类"""
+
+    vectorstore: Any
+    k: int = RETRIEVAL_K
+    """返回的分块数"""
+    sources: Optional[List[str]] = None
+    """只检索这些文件中的分块"""
+    timings: Any = None
+    """阶段名 -> 耗时（秒），为空时不记录。声明为 Any，pydantic 才会保留调用方传入的字典而不是复制一份"""
+    query_vector: Optional[List[float]] = None
+    """预先算好的问题向量，为空时由检索器计算"""
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.timings is not None:
+                self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def embed(self, query: str, queries: List[str]) -> List[List[float]]:
+        """一次调用计算多个查询的向量，原始问题已有 query_vector 时不再计算"""
+        known = {query: self.query_vector} if self.query_vector is not None else {}
+        missing = [text for text in queries if text not in known]
+        if len(missing) == 1:
+            known[missing[0]] = self.vectorstore.embeddings.embed_query(missing[0])
+        elif missing:
+            known.update(zip(missing, embed_queries(self.vectorstore.embeddings, missing)))
+        return [known[text] for text in queries]
+
+    def search_filter(self):
+        return source_filter(self.sources) if self.sources else None
+
+    def search_by_vector(self, vector: List[float], k: int) -> List[Document]:
+        """向量检索，相似度写入 metadata.score"""
+        results = self.vectorstore.similarity_search_with_score_by_vector(vector, k=k, filter=self.search_filter())
+        docs = []
+        for doc, score in results:
+            doc.metadata["score"] = round(float(score), 4)
+            docs.append(doc)
+        return docs
+
+
+class VectorRetriever(TimedRetriever):
+    """单次向量检索"""
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with self.stage("embed"):
+            vector = self.embed(query, [query])[0]
+        with self.stage("search"):
+            return self.search_by_vector(vector, self.k)
+
+
+class ConcurrentMultiQueryRetriever(TimedRetriever):
+    """大模型改写查询 + 批量嵌入 + 并发向量检索"""
+
+    llm: Any
+    llm_slot: Any = None
+    """改写查询前需要获取的信号量（与生成回答共用），为空时不限制"""
+    include_original: bool = True
+    """是否连同原始问题一起检索"""
+
+    def generate_queries(self, question: str) -> List[str]:
+        with self.llm_slot or nullcontext():
+            output = (DEFAULT_QUERY_PROMPT | self.llm).invoke({"question": question})
+        text = output if isinstance(output, str) else str(output.content)
+        queries = [line.strip() for line in text.splitlines() if line.strip()]
+        if self.include_original:
+            queries.insert(0, question)
+        # 去掉重复的查询，保持顺序
+        return list(dict.fromkeys(queries))
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with self.stage("rewrite"):
+            queries = self.generate_queries(query)
+        with self.stage("embed"):
+            vectors = self.embed(query, queries)
+        with self.stage("search"):
+            rankings = list(_search_pool.map(lambda vector: self.search_by_vector(vector, self.k), vectors))
+        with self.stage("fuse"):
+            return reciprocal_rank_fusion(rankings)[:self.k]
+
+
+class HybridRetriever(TimedRetriever):
+    """向量 + BM25 混合检索"""
+
+    lexical_index: Any
+    fetch_k: int = RETRIEVAL_FETCH_K
+    """每一路检索的候选数"""
+    rrf_k: int = RRF_K
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with self.stage("embed"):
+            vector = self.embed(query, [query])[0]
+        # 向量检索放到线程池，与 BM25 检索同时进行
+        with self.stage("search"):
+            dense = _search_pool.submit(self.search_by_vector, vector, self.fetch_k)
+            lexical = [doc for doc, _ in self.lexical_index.search(query, self.fetch_k, self.sources)]
+            dense = dense.result()
+        with self.stage("fuse"):
+            return reciprocal_rank_fusion([dense, lexical], self.rrf_k)[:self.k]
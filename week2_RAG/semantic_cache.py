@@ -0,0 +1,130 @@
+"""
+语义答案缓存
+用户经常用略有不同的说法问同一个问题。问题向量（复用 m3e-base 嵌入）与缓存中某个历史问题的
+余弦相似度超过阈值时，直接返回缓存的回答和来源，省去查询改写、检索和生成。
+文档索引版本变化（入库、增量同步、重建）时缓存整体失效，不会返回基于旧文档的回答。
+"""
+
+import os
+import copy
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """内存中的问题向量矩阵 + 回答，按相似度查找，超过上限时淘汰最旧的条目"""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 500, ttl: float = 3600):
+        """
+        初始化语义缓存
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            max_entries: 最多缓存的问题数
+            ttl: 缓存有效期（秒）
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Dict[str, Any]] = []
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, vector: List[float], scope: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        查找相似的历史问题
+        Args:
+            vector: 问题向量
+            scope: 检索范围（例如来源文件过滤条件），只匹配相同范围的条目
+            version: 当前文档索引版本，与缓存版本不同时清空缓存
+        Returns:
+            Optional[dict]: 命中时返回 {"question", "similarity", "result"}
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            best, best_score = None, self.threshold
+            if self._entries:
+                scores = self._vectors @ query
+                for index in np.argsort(-scores):
+                    score = float(scores[index])
+                    if score < best_score:
+                        break
+                    entry = self._entries[index]
+                    if entry["scope"] == scope and entry["expires_at"] > now:
+                        best, best_score = entry, score
+                        break
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {"question": best["question"], "similarity": round(best_score, 4),
+                    "result": copy.deepcopy(best["result"])}
+
+    def store(self, question: str, vector: List[float], scope: str, version: str, result: Dict[str, Any]):
+        """缓存一个回答"""
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(version)
+            self._entries.append({"question": question, "scope": scope, "result": copy.deepcopy(result),
+                                  "expires_at": time.time() + self.ttl})
+            rows = query[np.newaxis, :]
+            self._vectors = rows if self._vectors is None else np.vstack([self._vectors, rows])
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "index_version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_version(self, version: str):
+        """索引版本变化时清空缓存（调用方需持有锁）"""
+        if version == self.version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries = []
+        self._vectors = None
+        self.version = version
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """
+    根据环境变量创建语义缓存，未启用时返回None
+    RAG_SEMANTIC_CACHE: 是否启用（默认0）
+    RAG_SEMANTIC_CACHE_THRESHOLD: 命中所需的最小余弦相似度（默认0.95）
+    RAG_SEMANTIC_CACHE_MAX_ENTRIES / RAG_SEMANTIC_CACHE_TTL: 条目上限 / 有效期秒数
+    """
+    if os.getenv("RAG_SEMANTIC_CACHE", "0") != "1":
+        return None
+    return SemanticCache(
+        threshold=float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("RAG_SEMANTIC_CACHE_MAX_ENTRIES", "500")),
+        ttl=float(os.getenv("RAG_SEMANTIC_CACHE_TTL", "3600"))
+    )
@@ -7,6 +7,47 @@ document.addEventListener("DOMContentLoaded", () => {
 
     console.log("DOM elements initialized.");
 
+    // 渲染检索到的来源（文件、页码、得分）
+    function renderSources(container, sources) {
+        if (!sources || sources.length === 0) {
+            container.textContent = "未检索到相关内容";
+            return;
+        }
+        const list = document.createElement("ul");
+        list.className = "source-list";
+        sources.forEach((item) => {
+            const li = document.createElement("li");
+            let text = item.source || "未知文件";
+            if (item.page !== null && item.page !== undefined) {
+                text += ` 第${item.page + 1}页`;
+            }
+            if (item.score !== null && item.score !== undefined) {
+                text += `（得分 ${Number(item.score).toFixed(3)}）`;
+            }
+            li.textContent = text;
+            list.appendChild(li);
+        });
+        container.replaceChildren(list);
+    }
+
+    // 读取SSE流，逐个回调事件数据
+    async function readEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split("\n\n");
+            buffer = events.pop();
+            events.forEach((event) => {
+                const line = event.split("\n").find((l) => l.startsWith("data: "));
+                if (line) onEvent(JSON.parse(line.slice(6)));
+            });
+        }
+    }
+
     submitButton.addEventListener("click", async () => {
         const question = questionInput.value.trim();
         console.log("Submit button clicked.");
@@ -18,9 +59,20 @@ document.addEventListener("DOMContentLoaded", () => {
             return;
         }
 
+        const card = document.createElement("div");
+        card.className = "result-card";
+        const sourcesBox = document.createElement("div");
+        sourcesBox.className = "sources";
+        sourcesBox.textContent = "正在检索...";
+        const answerBox = document.createElement("p");
+        card.appendChild(sourcesBox);
+        card.appendChild(answerBox);
+        resultSection.appendChild(card);
+        submitButton.disabled = true;
+
         try {
-            console.log("Sending request to /ask endpoint...");
-            const response = await fetch("/ask", {
+            console.log("Sending request to /ask/stream endpoint...");
+            const response = await fetch("/ask/stream", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -32,21 +84,23 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            console.log("Response received:", response);
-            const data = await response.json();
-            console.log("Parsed response data:", data);
-
-            const answer = data.answer.result; // 解析后端返回的 result 字段
-            console.log("Answer extracted:", answer);
-
-            const card = document.createElement("div");
-            card.className = "result-card";
-            card.innerHTML = `<p>${answer}</p>`;
-            resultSection.appendChild(card);
-            console.log("Answer card added to result section.");
+            // 先显示来源，再逐个追加回答的token
+            await readEvents(response, (data) => {
+                if (data.sources) {
+                    renderSources(sourcesBox, data.sources);
+                } else if (data.token) {
+                    answerBox.textContent += data.token;
+                } else if (data.done) {
+                    console.log("Answer finished, timings:", data.timings);
+                } else if (data.error) {
+                    throw new Error(data.error);
+                }
+            });
         } catch (error) {
             console.error("Error fetching answer:", error);
-            alert("获取答案时出错，请稍后重试。");
+            answerBox.textContent += "\n获取答案时出错，请稍后重试。";
+        } finally {
+            submitButton.disabled = false;
         }
     });
 });
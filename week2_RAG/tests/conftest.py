@@ -0,0 +1,5 @@
+import os
+import sys
+
+# week2_RAG 的模块是平铺的脚本，测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
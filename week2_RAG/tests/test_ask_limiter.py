@@ -0,0 +1,140 @@
+import asyncio
+import threading
+
+import pytest
+
+from ask_limiter import AskLimiter, Overloaded
+
+
+async def hold(limiter, entered, release):
+    async with limiter.slot():
+        entered.set()
+        await release.wait()
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = AskLimiter(max_in_flight=1, max_queue=1, queue_timeout=5)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, entered, release))
+        await entered.wait()
+        waiter = asyncio.create_task(limiter.run(lambda: "排队后执行"))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(Overloaded):
+            await limiter.run(lambda: "不会执行")
+        release.set()
+        await holder
+        assert await waiter == "排队后执行"
+        return limiter.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected_queue_full"] == 1
+    assert metrics["max_queued_seen"] == 1
+    assert metrics["completed"] == 2
+    assert metrics["queued"] == metrics["in_flight"] == 0
+
+
+def test_rejects_after_queue_timeout():
+    async def scenario():
+        limiter = AskLimiter(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, entered, release))
+        await entered.wait()
+
+        with pytest.raises(Overloaded):
+            await limiter.run(lambda: "不会执行")
+        release.set()
+        await holder
+        return limiter.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected_timeout"] == 1
+    assert metrics["rejected_queue_full"] == 0
+    assert metrics["queued"] == metrics["in_flight"] == 0
+
+
+def test_counts_failures_and_streams_items():
+    def broken():
+        raise RuntimeError("失败")
+
+    async def scenario():
+        limiter = AskLimiter(max_in_flight=2, max_queue=2, queue_timeout=1)
+        with pytest.raises(RuntimeError):
+            await limiter.run(broken)
+        items = [item async for item in limiter.stream(lambda n: iter(range(n)), 3)]
+        return items, limiter.metrics()
+
+    items, metrics = asyncio.run(scenario())
+    assert items == [0, 1, 2]
+    assert metrics["failed"] == 1
+    assert metrics["completed"] == 1
+
+
+def test_batch_takes_only_free_slots():
+    def batch(workers):
+        yield workers
+
+    async def scenario():
+        limiter = AskLimiter(max_in_flight=3, max_queue=2, queue_timeout=1)
+        alone = [item async for item in limiter.stream(batch, slots=8)]
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, entered, release))
+        await entered.wait()
+        shared = [item async for item in limiter.stream(batch, slots=8)]
+        release.set()
+        await holder
+        return alone, shared, limiter.metrics()
+
+    alone, shared, metrics = asyncio.run(scenario())
+    assert alone == [3]
+    assert shared == [2]
+    assert metrics["in_flight"] == 0
+    assert metrics["completed"] == 3
+
+
+def test_closing_batch_stream_keeps_slots_until_questions_finish():
+    pytest.importorskip("langchain")
+    from batch_qa import run_batch
+
+    questions = ["快", "慢1", "慢2", "慢3"]
+    release = {question: threading.Event() for question in questions}
+    release["快"].set()
+    running = set()
+
+    class Embeddings:
+        def embed_documents(self, texts):
+            return [[0.0] for _ in texts]
+
+    class Chain:
+        embedding_model = Embeddings()
+
+        def ask_question(self, question, sources=None, generation_slot=None, vector=None):
+            running.add(question)
+            release[question].wait(5)
+            running.discard(question)
+            return {"result": question, "sources": [], "timings": {}}
+
+    items = [{"id": str(i), "question": q} for i, q in enumerate(questions)]
+
+    async def scenario():
+        limiter = AskLimiter(max_in_flight=4, max_queue=2, queue_timeout=1)
+        events = limiter.stream(run_batch, Chain(), items, slots=4)
+        assert (await events.__anext__())["type"] == "batch"
+        assert (await events.__anext__())["answer"] == "快"
+
+        # 客户端断开后第一个慢问题完成，生成器停止，其余两个问题仍在执行
+        closing = asyncio.create_task(events.aclose())
+        await asyncio.sleep(0.02)
+        release["慢1"].set()
+        await asyncio.sleep(0.1)
+        busy = limiter.metrics()["in_flight"], sorted(running), closing.done()
+        for event in release.values():
+            event.set()
+        await closing
+        return busy, limiter.metrics()
+
+    busy, metrics = asyncio.run(scenario())
+    assert busy == (4, ["慢2", "慢3"], False)
+    assert metrics["in_flight"] == 0
+    assert not running
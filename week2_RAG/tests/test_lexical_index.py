@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("langchain_community")
+
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from chunk_records import make_chunks
+from chunking import create_splitter
+from lexical_index import BM25Index
+from vector_index import delete_source, get_documents, iter_documents, memory_vectorstore, upsert_chunks
+
+SHARED = "两个文件中都出现的段落。"
+
+
+def write(store, source, text):
+    splitter = create_splitter("sentence", chunk_size=20, chunk_overlap=0)
+    upsert_chunks(store, make_chunks([Document(page_content=text, metadata={"source": source})], splitter))
+
+
+def sync(store, index, source, text=None):
+    """模拟增量同步：删除旧分块、写入新内容，再只更新这个文件的 BM25 分块"""
+    delete_source(store.client, store.collection_name, source)
+    if text is not None:
+        write(store, source, text)
+    previous = index.chunk_ids([source])
+    index.replace_sources([source], list(iter_documents(store, [source])) + get_documents(store, previous))
+
+
+def snapshot(index):
+    return {doc.page_content: doc.metadata["sources"] for doc, _ in index.search("文件 段落 内容 甲 乙 丙", k=100)}
+
+
+@pytest.fixture
+def store():
+    store = memory_vectorstore("test", DeterministicFakeEmbedding(size=16))
+    write(store, "a.txt", f"{SHARED}\n\n只在甲文件中的内容。")
+    write(store, "b.txt", f"{SHARED}\n\n只在乙文件中的内容。")
+    return store
+
+
+def test_replace_sources_matches_full_build(store):
+    index = BM25Index()
+    index.build(iter_documents(store))
+
+    sync(store, index, "a.txt", "只在丙文件中的内容。")
+    rebuilt = BM25Index()
+    rebuilt.build(iter_documents(store))
+
+    assert snapshot(index) == snapshot(rebuilt)
+    assert snapshot(index)[SHARED] == ["b.txt"]
+    assert index.chunk_ids(["a.txt"]) == rebuilt.chunk_ids(["a.txt"])
+    assert len(index) == len(rebuilt) == 3
+
+
+def test_removing_every_source_empties_index(store):
+    index = BM25Index()
+    index.build(iter_documents(store))
+
+    sync(store, index, "a.txt")
+    sync(store, index, "b.txt")
+
+    assert len(index) == 0
+    assert index.search("段落") == []
+    assert index.chunk_ids(["a.txt", "b.txt"]) == []
+
+
+def test_search_filters_by_source(store):
+    index = BM25Index()
+    index.build(iter_documents(store))
+
+    results = index.search("甲文件", k=10, sources=["b.txt"])
+    assert results
+    assert all("b.txt" in doc.metadata["sources"] for doc, _ in results)
@@ -0,0 +1,122 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("langchain_huggingface")
+pytest.importorskip("langchain_deepseek")
+
+from langchain.schema import Document
+from langchain_community.llms import FakeListLLM
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from RAGC import RAGChain
+from batch_qa import run_batch
+from chunk_records import make_chunks
+from chunking import create_splitter
+from vector_index import memory_vectorstore, upsert_chunks
+
+STAGES = {
+    "plain": {"embed", "search"},
+    "multi_query": {"rewrite", "embed", "search", "fuse"},
+    "hybrid": {"embed", "search", "fuse"},
+}
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.model = DeterministicFakeEmbedding(size=16)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self.model.embed_query(text)
+
+
+class RecordingSlot:
+    """记录进入次数，以及大模型调用时是否持有名额"""
+
+    def __init__(self):
+        self.entered = 0
+        self.held = False
+
+    def __enter__(self):
+        self.entered += 1
+        self.held = True
+
+    def __exit__(self, *exc):
+        self.held = False
+
+
+def make_chain(tmp_path, mode, responses):
+    rag_chain = RAGChain(str(tmp_path), "unused-model", "unused-key")
+    rag_chain.retrieval_mode = mode
+    rag_chain.answer_cache = None
+    rag_chain.embedding_model = CountingEmbeddings()
+    rag_chain.vectorstore = memory_vectorstore("test", rag_chain.embedding_model)
+    splitter = create_splitter("sentence", chunk_size=20, chunk_overlap=0)
+    document = Document(page_content="理想是前进的方向。\n\n产品编号 AB-1234。", metadata={"source": "a.txt"})
+    upsert_chunks(rag_chain.vectorstore, make_chunks([document], splitter))
+    rag_chain.refresh_lexical_index()
+    rag_chain.chat_model = FakeListLLM(responses=responses)
+    rag_chain.create_qa_chain()
+    return rag_chain
+
+
+@pytest.mark.parametrize("mode", sorted(STAGES))
+def test_ask_question_reports_retriever_stages(tmp_path, mode):
+    rag_chain = make_chain(tmp_path, mode, ["理想是什么\n理想的意义", "回答"] if mode == "multi_query" else ["回答"])
+
+    result = rag_chain.ask_question("理想是什么")
+
+    assert result["result"] == "回答"
+    assert result["sources"]
+    assert STAGES[mode] | {"retrieval", "generation", "total"} <= set(result["timings"])
+
+
+def test_precomputed_vector_skips_query_embedding(tmp_path):
+    rag_chain = make_chain(tmp_path, "plain", ["回答"])
+    vector = rag_chain.embedding_model.embed_query("理想是什么")
+    rag_chain.embedding_model.calls.clear()
+
+    result = rag_chain.ask_question("理想是什么", vector=vector)
+
+    assert result["sources"]
+    assert rag_chain.embedding_model.calls == []
+
+
+def test_query_rewrite_waits_for_generation_slot(tmp_path):
+    rag_chain = make_chain(tmp_path, "multi_query", ["理想是什么\n理想的意义", "回答"])
+    slot = RecordingSlot()
+    calls = []
+    invoke = type(rag_chain.chat_model).invoke
+
+    def recording_invoke(self, *args, **kwargs):
+        calls.append(slot.held)
+        return invoke(self, *args, **kwargs)
+
+    type(rag_chain.chat_model).invoke = recording_invoke
+    try:
+        rag_chain.ask_question("理想是什么", generation_slot=slot)
+    finally:
+        type(rag_chain.chat_model).invoke = invoke
+
+    assert slot.entered == 2
+    assert calls and all(calls)
+    # 原始问题没有预先计算的向量，改写后的两个查询和原始问题一起嵌入
+    assert rag_chain.embedding_model.calls[-1] == ["理想是什么", "理想的意义"]
+
+
+def test_run_batch_embeds_questions_once(tmp_path):
+    rag_chain = make_chain(tmp_path, "plain", ["回答"])
+    rag_chain.embedding_model.calls.clear()
+    items = [{"id": str(i), "question": q} for i, q in enumerate(["理想是什么", "产品编号", "前进的方向"])]
+
+    results = list(run_batch(rag_chain, items, workers=2, llm_concurrency=1))
+
+    assert results[0]["type"] == "batch"
+    assert sorted(result["id"] for result in results[1:]) == ["0", "1", "2"]
+    assert all("error" not in result for result in results[1:])
+    assert rag_chain.embedding_model.calls == [["理想是什么", "产品编号", "前进的方向"]]
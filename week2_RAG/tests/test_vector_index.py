@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("langchain_community")
+
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from chunk_records import make_chunks
+from chunking import create_splitter
+from vector_index import delete_source, iter_documents, memory_vectorstore, upsert_chunks
+
+SHARED = "两个文件中都出现的段落。"
+
+
+@pytest.fixture
+def vectorstore():
+    store = memory_vectorstore("test", DeterministicFakeEmbedding(size=16))
+    splitter = create_splitter("sentence", chunk_size=20, chunk_overlap=0)
+    documents = [
+        Document(page_content=f"{SHARED}\n\n只在甲文件中的内容。", metadata={"source": "a.txt"}),
+        Document(page_content=f"{SHARED}\n\n只在乙文件中的内容。", metadata={"source": "b.txt"}),
+    ]
+    for document in documents:
+        upsert_chunks(store, make_chunks([document], splitter))
+    return store
+
+
+def chunks_by_text(store):
+    return {doc.page_content: doc.metadata for doc in iter_documents(store)}
+
+
+def test_shared_chunk_is_stored_once(vectorstore):
+    chunks = chunks_by_text(vectorstore)
+    assert len(chunks) == 3
+    assert chunks[SHARED]["sources"] == ["a.txt", "b.txt"]
+    assert len(chunks[SHARED]["locations"]) == 2
+
+
+def test_delete_source_keeps_chunks_shared_with_other_files(vectorstore):
+    affected = delete_source(vectorstore.client, vectorstore.collection_name, "a.txt")
+
+    chunks = chunks_by_text(vectorstore)
+    assert affected == 2
+    assert set(chunks) == {SHARED, "只在乙文件中的内容。"}
+    assert chunks[SHARED]["sources"] == ["b.txt"]
+    assert chunks[SHARED]["source"] == "b.txt"
+    assert [loc["source"] for loc in chunks[SHARED]["locations"]] == ["b.txt"]
+
+
+def test_delete_last_source_removes_shared_chunk(vectorstore):
+    delete_source(vectorstore.client, vectorstore.collection_name, "a.txt")
+    delete_source(vectorstore.client, vectorstore.collection_name, "b.txt")
+
+    assert chunks_by_text(vectorstore) == {}
+    assert delete_source(vectorstore.client, vectorstore.collection_name, "b.txt") == 0
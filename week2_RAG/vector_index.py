@@ -0,0 +1,264 @@
+"""
+持久化向量索引
+使用 Qdrant 本地路径模式把向量保存在磁盘上，启动时直接加载而不是重新嵌入整个文档目录。
+索引目录中的 manifest.json 记录构建索引时的嵌入模型、分块参数和源文件哈希（读取失败的文件带 failed 字段），
+嵌入模型或分块参数变化时整体重建；文件增删改只增量更新对应文件的向量。
+全量重建写入一个新集合，完成后再切换（manifest 记录当前使用的集合），重建期间旧集合继续服务检索。
+注意：Qdrant 本地模式同一时刻只允许一个进程打开索引目录。
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from langchain_community.vectorstores import Qdrant
+from langchain.schema import Document
+
+from chunk_records import dedupe_chunks, merge_locations
+from embedding_pipeline import add_documents
+
+# 支持加载的文档类型
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_files(base_dir, previous=None):
+    """
+    返回目录下所有受支持文档的 {文件名: {"sha256", "mtime", "size"}}
+    previous 为上次扫描结果，修改时间和大小都没变的文件直接沿用上次的哈希，不再读取内容
+    """
+    if not os.path.exists(base_dir):
+        return {}
+    previous = previous or {}
+    files = {}
+    for file in sorted(os.listdir(base_dir)):
+        if not file.endswith(SUPPORTED_EXTENSIONS):
+            continue
+        stat = os.stat(os.path.join(base_dir, file))
+        old = previous.get(file)
+        if old and old.get("mtime") == stat.st_mtime and old.get("size") == stat.st_size:
+            files[file] = old
+        else:
+            files[file] = {
+                "sha256": file_sha256(os.path.join(base_dir, file)),
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            }
+    return files
+
+
+def create_collection(client, collection_name, embedding_model):
+    """按嵌入模型的向量维度创建空集合（余弦距离）"""
+    dimension = len(embedding_model.embed_query("dimension probe"))
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE),
+    )
+
+
+def memory_vectorstore(collection_name, embedding_model):
+    """创建内存模式的空向量存储，文档随后分批写入"""
+    client = QdrantClient(location=":memory:")
+    create_collection(client, collection_name, embedding_model)
+    return Qdrant(client=client, collection_name=collection_name, embeddings=embedding_model)
+
+
+def source_filter(sources):
+    """只检索来自指定文件的分块"""
+    return models.Filter(must=[
+        models.FieldCondition(key="metadata.sources", match=models.MatchAny(any=list(sources)))
+    ])
+
+
+def _to_document(point):
+    payload = point.payload or {}
+    return Document(page_content=payload.get("page_content") or "",
+                    metadata=payload.get("metadata") or {})
+
+
+def iter_documents(vectorstore, sources=None, batch_size=256):
+    """遍历向量库中的分块，指定 sources 时只遍历来自这些文件的分块"""
+    selector = source_filter(sources) if sources is not None else None
+    offset = None
+    while True:
+        points, offset = vectorstore.client.scroll(vectorstore.collection_name, scroll_filter=selector,
+                                                   limit=batch_size, offset=offset,
+                                                   with_payload=True, with_vectors=False)
+        for point in points:
+            yield _to_document(point)
+        if offset is None:
+            break
+
+
+def get_documents(vectorstore, ids):
+    """按分块ID读取分块，已不存在的ID被忽略"""
+    if not ids:
+        return []
+    points = vectorstore.client.retrieve(vectorstore.collection_name, ids=list(ids), with_payload=True)
+    return [_to_document(point) for point in points]
+
+
+def upsert_chunks(vectorstore, chunks):
+    """
+    写入分块，内容相同的分块只保留一个向量点：
+    批内重复的直接合并，库中已存在的把新位置合并进已有元数据后覆盖写入
+    Returns:
+        int: 被合并掉的重复分块数
+    """
+    chunks, duplicates = dedupe_chunks(chunks)
+    ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+    existing = vectorstore.client.retrieve(vectorstore.collection_name, ids=ids, with_payload=True)
+    by_id = {chunk.metadata["chunk_id"]: chunk for chunk in chunks}
+    for point in existing:
+        metadata = (point.payload or {}).get("metadata") or {}
+        chunk = by_id.get(str(point.id))
+        if chunk is not None and metadata.get("locations"):
+            merge_locations(chunk.metadata, metadata["locations"])
+            duplicates += 1
+    add_documents(vectorstore, chunks, ids=ids)
+    return duplicates
+
+
+def delete_source(client, collection_name, source):
+    """
+    删除某个源文件的分块：只属于该文件的向量点直接删除，
+    与其他文件共享的分块只去掉该文件的位置
+    Returns:
+        int: 删除或修改的向量点数
+    """
+    selector = models.Filter(must=[
+        models.FieldCondition(key="metadata.sources", match=models.MatchValue(value=source))
+    ])
+    offset, affected = None, 0
+    while True:
+        points, offset = client.scroll(collection_name, scroll_filter=selector, limit=256,
+                                       offset=offset, with_payload=True, with_vectors=False)
+        affected += len(points)
+        for point in points:
+            metadata = point.payload.get("metadata") or {}
+            locations = [loc for loc in metadata.get("locations", []) if loc.get("source") != source]
+            if not locations:
+                continue
+            metadata["locations"] = []
+            merge_locations(metadata, locations)
+            metadata.update(locations[0])
+            client.set_payload(collection_name, payload={"metadata": metadata}, points=[point.id])
+        if offset is None:
+            break
+    # 共享分块已去掉该文件，剩下的都只属于该文件
+    if affected:
+        client.delete(collection_name=collection_name, points_selector=models.FilterSelector(filter=selector))
+    return affected
+
+
+def diff_files(previous, current):
+    """比较两次扫描结果，返回 (新增, 修改, 删除) 的文件名列表"""
+    added = [file for file in current if file not in previous]
+    changed = [file for file in current
+               if file in previous and current[file]["sha256"] != previous[file]["sha256"]]
+    removed = [file for file in previous if file not in current]
+    return added, changed, removed
+
+
+class PersistentIndex:
+    def __init__(self, index_dir, collection_name="my_documents"):
+        self.index_dir = index_dir
+        # 集合名前缀；全量重建生成的集合名为 前缀_时间_随机串
+        self.base_name = collection_name
+        # 当前使用的集合，加载 manifest 时更新
+        self.collection_name = collection_name
+        self.manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        self._client = None
+
+    @property
+    def client(self):
+        # 本地模式会锁定目录，整个进程共用一个客户端
+        if self._client is None:
+            os.makedirs(self.index_dir, exist_ok=True)
+            self._client = QdrantClient(path=os.path.join(self.index_dir, "qdrant"))
+        return self._client
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, settings, files):
+        manifest = {
+            "settings": settings,
+            "files": files,
+            "collection_name": self.collection_name,
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def collection_names(self):
+        return [c.name for c in self.client.get_collections().collections]
+
+    def collection_exists(self):
+        return self.collection_name in self.collection_names()
+
+    def mismatch_reason(self, settings):
+        """
+        返回索引需要整体重建的原因，可用时返回 None
+        文档内容的变化不需要重建，由增量同步处理
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            return "索引不存在"
+        if manifest.get("settings") != settings:
+            return "嵌入模型或分块参数已变化"
+        self.collection_name = manifest.get("collection_name", self.base_name)
+        if not self.collection_exists():
+            return "向量集合缺失"
+        return None
+
+    def delete_source(self, source):
+        """删除某个源文件的全部分块，返回删除或修改的向量点数"""
+        return delete_source(self.client, self.collection_name, source)
+
+    def open(self, embedding_model, collection_name=None):
+        return Qdrant(
+            client=self.client,
+            collection_name=collection_name or self.collection_name,
+            embeddings=embedding_model,
+        )
+
+    def create_staging(self, embedding_model):
+        """
+        为全量重建新建一个空集合，文档随后分批写入；切换前当前集合不受影响
+        Returns:
+            tuple: (新集合名, 指向新集合的向量存储)
+        """
+        name = f"{self.base_name}_{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        create_collection(self.client, name, embedding_model)
+        return name, self.open(embedding_model, name)
+
+    def activate(self, collection_name, settings, files):
+        """
+        切换到重建好的集合：先写 manifest，再删除旧集合和此前重建中断遗留的集合
+        """
+        self.collection_name = collection_name
+        self.save_manifest(settings, files)
+        for name in self.collection_names():
+            if name != collection_name and (name == self.base_name or name.startswith(self.base_name + "_")):
+                self.client.delete_collection(name)